@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Mede o tempo das etapas de `covid.py` com dados sintéticos.
+
+Gera arquivos de cidades no formato de `Piracicaba.txt` e CSVs no formato da
+SEADE em várias escalas (1x, 10x, 100x o tamanho atual) e mede separadamente
+a leitura, o cálculo das séries, as regressões e os gráficos.
+Nenhum acesso à rede é feito.
+Os resultados são gravados em JSON para comparar execuções:
+
+    python benchmark.py --saida bench.json
+    python benchmark.py --saida novo.json --compara bench.json
+'''
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+import covid  # noqa: E402
+
+# tamanho dos dados atuais: dias de dados de Piracicaba e municípios de SP
+DIAS_CIDADE = 130
+REGISTROS_DIA = 60
+MUNICIPIOS_SEADE = 645
+DIAS_SEADE = 100
+
+COLUNAS_SEADE = ["nome_munic", "codigo_ibge", "dia", "mes", "datahora",
+                 "casos", "casos_novos", "casos_pc", "casos_mm7d", "obitos",
+                 "obitos_novos", "obitos_pc", "obitos_mm7d", "letalidade",
+                 "nome_ra", "cod_ra", "nome_drs", "cod_drs", "pop", "pop_60",
+                 "area", "map_leg", "map_leg_s", "latitude", "longitude",
+                 "semana_epidem"]
+
+
+def gera_cidade(arquivo, dias, por_dia=REGISTROS_DIA, semente=0):
+    """ Gera um arquivo de cidade no formato de `Piracicaba.txt`
+
+    Parametros:
+    -----------
+    arquivo: str
+        Caminho do arquivo gerado
+    dias: int
+        Número de dias de dados
+    por_dia: int
+        Número médio de registros de casos por dia
+    """
+    rng = random.Random(semente)
+    inicio = datetime.date(2020, 3, 1)
+    with open(arquivo, 'w') as saida:
+        saida.write("## Data   Tipo   Número   Sexo   Idade  ## Observações\n")
+        for d in range(dias):
+            data = inicio + datetime.timedelta(days=d)
+            if d > 0 and data.weekday() >= 5 and rng.random() < 0.5:
+                continue  # fins de semana sem dados
+            texto = data.strftime("%Y%m%d")
+            casos = rng.randint(0, 2 * por_dia)
+            if casos == 0:
+                saida.write(texto + "   P       0       -      --\n")
+            for _ in range(casos):
+                saida.write(texto + "   P       1       "
+                            + registro_pessoal(rng) + "\n")
+            mortes = rng.randint(0, max(1, por_dia // 20))
+            if d == 0:
+                mortes = max(mortes, 1)
+            for _ in range(mortes):
+                saida.write(texto + "   M       1       "
+                            + registro_pessoal(rng) + "     ## óbito\n")
+
+
+def registro_pessoal(rng):
+    """ Sorteia os campos de sexo e idade de um registro"""
+    if rng.random() < 0.1:
+        return("-      --")
+    return(rng.choice("MF") + "      " + str(rng.randint(0, 99)))
+
+
+def gera_seade(arquivo, municipios, dias=DIAS_SEADE, semente=0):
+    """ Gera um CSV no formato dos dados da SEADE
+
+    Parametros:
+    -----------
+    arquivo: str
+        Caminho do arquivo gerado
+    municipios: int
+        Número de municípios
+    dias: int
+        Número de dias de dados
+    """
+    rng = random.Random(semente)
+    inicio = datetime.date(2020, 2, 25)
+    nomes = ["Município " + str(i) for i in range(municipios)]
+    acumulados = [[0, 0] for _ in nomes]
+    with open(arquivo, 'w', encoding='utf-8') as saida:
+        saida.write(";".join(COLUNAS_SEADE) + "\n")
+        for d in range(dias):
+            data = inicio + datetime.timedelta(days=d)
+            for i, nome in enumerate(nomes):
+                casos, obitos = acumulados[i]
+                if d > 5 + i % 30:
+                    casos += rng.randint(0, 3 + d)
+                    if rng.random() < 0.4:
+                        obitos += rng.randint(0, 2)
+                acumulados[i] = [casos, obitos]
+                linha = [nome, str(3500000 + i), str(data.day),
+                         str(data.month), data.isoformat(), str(casos), "0",
+                         "0", "0", str(obitos), "0", "0", "0", "0",
+                         "RA " + str(i % 16), str(i % 16),
+                         "DRS " + str(i % 17), str(i % 17),
+                         str(10000 + 97 * i), "0", "0", "0", "0", "-22,0",
+                         "-47,0", str(data.isocalendar()[1])]
+                saida.write(";".join(linha) + "\n")
+
+
+def mede(funcao, repeticoes):
+    """ Executa a função `repeticoes` vezes e retorna os tempos (s)"""
+    tempos = []
+    for _ in range(repeticoes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        plt.close('all')
+    return(tempos)
+
+
+def codifica(fig):
+    """ Codifica a figura em PNG na memória e a libera"""
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def etapas_cidade(arquivo):
+    """ Lista as etapas medidas para um arquivo de cidade"""
+    cid = covid.Covid(arquivo)
+    etapas = [
+        ("leitura", lambda: covid.LeitorCasos().le(arquivo)),
+        ("carrega_casos", lambda: covid.carrega_casos(arquivo)),
+        ("scrap", lambda: cid.scrap("P")),
+        ("scrap_pessoal", lambda: cid.scrap_pessoal("P")),
+        ("calcula_series", cid.calcula_series),
+        ("completa_dados", cid.completa_dados),
+        ("media", lambda: cid.media(cid.colunas["dias"],
+                                    cid.colunas["conf"])),
+        ("ajustes", cid.ajustes),
+        ("fit", lambda: cid.fit(14, 28)),
+        ("graf_detalhes", lambda: cid.graf_detalhes(salva=True)),
+        ("graf_fit", lambda: cid.graf_fit(14, 28)),
+    ]
+    for metodo, _ in covid.GRAFICOS.values():
+        etapas.append((metodo, getattr(cid, metodo)))
+        etapas.append((metodo + ":savefig",
+                       lambda metodo=metodo: codifica(getattr(cid, metodo)())))
+    modelo = covid.ModeloTotal()
+    etapas.append(("graf_all:modelo", lambda: modelo.atualiza(cid)))
+    return(etapas)
+
+
+def etapas_seade(arquivo):
+    """ Lista as etapas medidas para um CSV da SEADE"""
+    with open(arquivo, 'r', encoding='utf-8') as ent:
+        indice = covid.indexa_seade(ent)
+    cid = covid.Covid(nome="Município 1", dados_seade=indice)
+
+    def indexa():
+        with open(arquivo, 'r', encoding='utf-8') as ent:
+            covid.indexa_seade(ent)
+
+    def relatorio():
+        # páginas de todos os municípios; a partir da segunda repetição,
+        # nenhuma muda
+        paginas = covid.Relatorio(covid.Manifesto("manifesto.json"))
+        paginas.adiciona_seade(covid.PainelSeade(indice))
+        paginas.grava()
+
+    return([("indexa_seade", indexa),
+            ("scrap_seade", lambda: cid.scrap_seade(indice)),
+            ("Covid(seade)", lambda: covid.Covid(nome="Município 1",
+                                                 dados_seade=indice)),
+            ("relatorio", relatorio)])
+
+
+def executa(escalas, repeticoes, graficos_ate, diretorio):
+    """ Gera os dados sintéticos e mede todas as etapas
+
+    Parametros:
+    -----------
+    escalas: lista de int
+        Fatores de multiplicação do tamanho atual dos dados
+    repeticoes: int
+        Número de execuções de cada etapa
+    graficos_ate: int
+        Maior escala em que os gráficos são medidos
+    diretorio: str
+        Diretório de trabalho para os arquivos gerados
+    """
+    resultados = []
+    os.makedirs(os.path.join(diretorio, "img"), exist_ok=True)
+    anterior = os.getcwd()
+    os.chdir(diretorio)  # graf_* salvam os arquivos em img/
+    try:
+        for escala in escalas:
+            arquivo = "cidade-" + str(escala) + ".txt"
+            gera_cidade(arquivo, DIAS_CIDADE * escala)
+            with contextlib.redirect_stdout(io.StringIO()):
+                etapas = etapas_cidade(arquivo)
+            arquivo = "seade-" + str(escala) + ".csv"
+            gera_seade(arquivo, MUNICIPIOS_SEADE * escala)
+            etapas += etapas_seade(arquivo)
+            for nome, funcao in etapas:
+                grafico = nome.startswith("graf_") or nome == "fit"
+                if grafico and escala > graficos_ate:
+                    continue
+                print("Medindo " + nome + " (" + str(escala) + "x)",
+                      file=sys.stderr)
+                tempos = mede(funcao, repeticoes)
+                resultados.append({"etapa": nome, "escala": escala,
+                                   "min": min(tempos),
+                                   "media": sum(tempos) / len(tempos),
+                                   "repeticoes": repeticoes})
+    finally:
+        os.chdir(anterior)
+    return(resultados)
+
+
+def compara(resultados, anteriores, tolerancia=0.1):
+    """ Mostra a variação de tempo em relação a uma execução anterior"""
+    base = {(r["etapa"], r["escala"]): r["min"]
+            for r in anteriores["resultados"]}
+    for r in resultados:
+        chave = (r["etapa"], r["escala"])
+        if chave not in base or base[chave] == 0:
+            continue
+        razao = r["min"] / base[chave]
+        marca = ""
+        if razao > 1 + tolerancia:
+            marca = "  <- mais lento"
+        elif razao < 1 - tolerancia:
+            marca = "  <- mais rápido"
+        print("{:<28}{:>5}x {:>10.4f}s {:>7.2f}x{}".format(
+            r["etapa"], r["escala"], r["min"], razao, marca))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--escalas", type=int, nargs="+",
+                        default=[1, 10, 100])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--graficos-ate", type=int, default=1,
+                        help="maior escala em que os gráficos são medidos")
+    parser.add_argument("--saida", default="bench.json")
+    parser.add_argument("--compara", help="resultado anterior em JSON")
+    args = parser.parse_args()
+    saida = os.path.abspath(args.saida)
+    anteriores = None
+    if args.compara:
+        with open(args.compara, 'r') as ent:
+            anteriores = json.load(ent)
+    with tempfile.TemporaryDirectory() as diretorio:
+        resultados = executa(args.escalas, args.repeticoes,
+                             args.graficos_ate, diretorio)
+    relatorio = {"python": platform.python_version(),
+                 "numpy": np.__version__,
+                 "matplotlib": matplotlib.__version__,
+                 "plataforma": platform.platform(),
+                 "data": datetime.datetime.now().isoformat(),
+                 "resultados": resultados}
+    with open(saida, 'w') as arq:
+        json.dump(relatorio, arq, indent=1)
+    if anteriores is not None:
+        compara(resultados, anteriores)
+    else:
+        for r in resultados:
+            print("{:<28}{:>5}x {:>10.4f}s".format(r["etapa"], r["escala"],
+                                                 r["min"]))
@@ -7,24 +7,113 @@ Piracicaba e elaborar gráficos de sua evolução.
 '''
 
 import re
+import sys
+import argparse
+import bisect
 import datetime
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import matplotlib.patches as mpatches
-import matplotlib.lines as mlines
+import importlib
+import importlib.util
 import math
-import urllib.request
+import urllib.error
 import numpy as np
-import pylab
 import csv
+import os
+import json
+import hashlib
+import filecmp
+import shutil
+import subprocess
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import time
+import cProfile
+import tracemalloc
 
-matplotlib.rcParams['font.family'] = "monospace"
-plt.rcParams.update({'figure.max_open_warning': 0})
+
+class ModuloAdiado:
+    """ Módulo importado apenas no primeiro acesso a um de seus atributos
+
+    O matplotlib é responsável pela maior parte do tempo de importação deste
+    arquivo e não é usado para ler, validar ou exportar os dados, então ele
+    só é importado quando algum gráfico é gerado.
+    """
+    def __init__(self, nome, inicia=None):
+        self._nome = nome
+        self._inicia = inicia
+
+    def __getattr__(self, atributo):
+        modulo = importlib.import_module(self._nome)
+        if self._inicia is not None:
+            self._inicia()
+        return(getattr(modulo, atributo))
+
+
+def configura_matplotlib():
+    """ Configurações do matplotlib, aplicadas uma vez na importação"""
+    if configura_matplotlib.feito:
+        return
+    configura_matplotlib.feito = True
+    importlib.import_module("matplotlib").rcParams['font.family'] = (
+        "monospace")
+
+
+configura_matplotlib.feito = False
+matplotlib = ModuloAdiado("matplotlib", configura_matplotlib)
+plt = ModuloAdiado("matplotlib.pyplot", configura_matplotlib)
+ticker = ModuloAdiado("matplotlib.ticker", configura_matplotlib)
+mpatches = ModuloAdiado("matplotlib.patches", configura_matplotlib)
+mlines = ModuloAdiado("matplotlib.lines", configura_matplotlib)
+figura = ModuloAdiado("matplotlib.figure", configura_matplotlib)
+imagem = ModuloAdiado("matplotlib.image", configura_matplotlib)
+agg = ModuloAdiado("matplotlib.backends.backend_agg", configura_matplotlib)
+pillow = ModuloAdiado("PIL.Image")
+requisicoes = ModuloAdiado("urllib.request")
+# opcional, usado apenas para exportar em Parquet
+pyarrow = ModuloAdiado("pyarrow")
+parquet = ModuloAdiado("pyarrow.parquet")
+
+DIR_DADOS = "dados"
+URL_SEADE = ("https://raw.githubusercontent.com/seade-R/dados-covid-sp/"
+             "master/data/dados_covid_sp.csv")
+DIR_CACHE = "cache"  # diretório com os dados baixados e processados
+
+# tempos das etapas são enviados para este logger (nível DEBUG) e para as
+# funções registradas com `registra_observador`
+logger = logging.getLogger("covid")
+observadores = []
+modelos_abertos = {}  # figuras de `MODELOS` já criadas neste processo
+
+# sexos e faixas etárias usados nos gráficos de `graf_detalhes`
+TIPOS = ["P", "M"]  # casos confirmados e mortes
+SEXOS = ["M", "F", "-"]
+FAIXAS = ['-', '0-9', '10-19', '20-29', '30-39', '40-49',
+          '50-59', '60-69', '70-79', '80-89', '90-']  # mais de 90 juntos
+
+# incrementar quando a aparência dos gráficos mudar, para que o manifesto
+# não considere atualizadas as figuras geradas pela versão anterior
+VERSAO_GRAFICOS = 1
+# versão do formato de `LeitorCasos.salva`
+VERSAO_CASOS = 5
+# versão do formato de `IndiceSeade.salva`, parte do nome do índice no cache
+# (a 2 inclui a população e a região de cada município)
+VERSAO_INDICE_SEADE = 2
+
+# gráficos gerados por `atualiza_graf`: sufixo do arquivo, método que cria a
+# figura e a série cuja última data é usada no nome (None para a mais recente)
+GRAFICOS = {"-novoscasos": ("graf_conf", "data"),
+            "-totalcasos": ("graf_conf_acc", "data"),
+            "-casosconfirmados": ("graf_conf_both", "data"),
+            "-novasmortes": ("graf_mort", "data_mort"),
+            "-totalmortes": ("graf_mort_acc", "data_mort"),
+            "-mortes": ("graf_mort_both", "data_mort"),
+            "": ("graf_all", None)}
 
 
 class Covid:
-    def __init__(self, nome_arquivo="", nome="", dados_seade=""):
+    def __init__(self, nome_arquivo="", nome="", dados_seade="",
+                 renderizador=None, cache=DIR_CACHE):
         """
         Parametros:
         -----------
@@ -34,7 +123,16 @@ class Covid:
         nome: str
             nome da cidade a ser exibido nos gráficos e usado para salvar os
             arquivos.
+        renderizador: Renderizador
+            responsável por salvar e liberar as figuras.
+        cache: str
+            Diretório onde os registros lidos do arquivo são guardados em
+            formato binário (ver `carrega_casos`). Se None, o arquivo é
+            sempre lido.
         """
+        if renderizador is None:
+            renderizador = Renderizador()
+        self.renderizador = renderizador
         if nome_arquivo != "":
             self.arquivo = nome_arquivo
         else:
@@ -47,37 +145,69 @@ class Covid:
             self.fonte = "Fonte: SEADE/SP"
         if nome_arquivo == "":
             # processa dados da SEADE
-            (self.data, self.conf,
+            (datas, conf,
              self.data_mort, self.mortes) = self.scrap_seade(dados_seade)
+            self.define_casos(datas, conf)
         else:
-            # processa arquivo de entrada
-            [self.data, self.conf] = self.scrap("P")
-            [self.data_mort, self.mortes] = self.scrap("M")
-        # converte a lista de datas em números,
-        # começando por 0 para graficos
-        self.dias = self.dias_corridos(self.data)
-        self.dias_mort = self.dias_corridos(self.data_mort)
-        # calcula o tempo até a primeira morte,
-        # necessário para colocar os gráficos juntos
-        self.diff_morte = abs((
-            datetime.datetime.strptime(self.data_mort[0], "%Y%m%d")
-            - datetime.datetime.strptime(self.data[0], "%Y%m%d")).days)
-        self.completa_dados()  # preenche lacunas nos dados de mortes
-        # calcula os números acumulados
-        self.acc_conf = self.acumulados(self.data, self.conf)
-        self.acc_mort = self.acumulados(self.data_mort, self.mortes)
-        # ### desloca eixo x de mortes
-        self.dias_mort_corr = []
-        for dia in self.dias_mort:
-            self.dias_mort_corr.append(dia + self.diff_morte)
-        # calcula média dos últimos 7 dias
-        self.med_conf = self.media(self.dias, self.conf)
-        self.med_mort = self.media(self.dias_mort, self.mortes)
+            # processa arquivo de entrada, lido uma única vez
+            self.registros = carrega_casos(self.arquivo, cache)
+            # erros nos dados interrompem antes de qualquer gráfico
+            self.registros.verifica(self.arquivo)
+            self.define_casos(*self.registros.colunas("P"))
+            [self.data_mort, self.mortes] = self.registros.colunas("M")
+        self.calcula_series()
         self.limpa_datas_marcadas()
         # se usa dados detalhados (não SEADE), cria detalhamentos
         if dados_seade == "":
             self.det_conf = self.scrap_pessoal("P")
             self.det_mort = self.scrap_pessoal("M")
+            self.det_acc = acumula_demografia(self.det_conf, self.det_mort)
+
+    def atualiza(self):
+        """ Processa as linhas acrescentadas ao arquivo de entrada
+
+        Apenas as linhas novas são lidas (ver `LeitorCasos.continua`) e as
+        séries são recalculadas a partir dos dados já processados.
+        Lança ErroValidacao se houver erros no arquivo.
+        Retorna True se os dados mudaram.
+        """
+        if self.arquivo is None or not self.registros.continua(self.arquivo):
+            return(False)
+        self.registros.verifica(self.arquivo)
+        self.define_casos(*self.registros.colunas("P"))
+        [self.data_mort, self.mortes] = self.registros.colunas("M")
+        self.calcula_series()
+        self.limpa_datas_marcadas()
+        self.det_conf = self.scrap_pessoal("P")
+        self.det_mort = self.scrap_pessoal("M")
+        self.det_acc = acumula_demografia(self.det_conf, self.det_mort)
+        return(True)
+
+    def define_casos(self, datas, conf):
+        """ Guarda as colunas de datas e de casos por dia em `self.colunas`
+
+        Arrays já no formato das colunas (como os mapeados do cache, ver
+        `LeitorCasos.colunas`) são usados sem cópia; as listas `data` e
+        `conf` são geradas apenas quando usadas.
+        """
+        self.colunas = {"datas": converte_datas(datas),
+                        "conf": np.asarray(conf, dtype=np.int32)}
+        self._data = None
+        self._conf = None
+
+    @property
+    def data(self):
+        """ Lista das datas (AAAAMMDD) com casos"""
+        if self._data is None:
+            self._data = formata_datas(self.colunas["datas"])
+        return(self._data)
+
+    @property
+    def conf(self):
+        """ Lista dos casos por dia"""
+        if self._conf is None:
+            self._conf = self.colunas["conf"].tolist()
+        return(self._conf)
 
     def scrap(self, mark):
         """ Processa o arquivo de entrada para obter os dados consolidados
@@ -87,55 +217,64 @@ class Covid:
             Qual tipo de dado deve ser buscado.
             Tipos usados atualmente `P` para novos casos e `M` para mortes.
         """
-        data = []
-        conf = []
-        re_pad = re.compile("([0-9]{8}) +" + mark + " +([0-9]+).*")
-        ent = open(self.arquivo, 'r')
-        dados = ent.read()
-        matches = re.findall(re_pad, dados)
-        for match in matches:
-            if data == []:
-                data.append(match[0])
-                conf.append(int(match[1]))
-                continue
-            if match[0] == data[-1]:
-                conf[-1] += int(match[1])
-            else:
-                data.append(match[0])
-                conf.append(int(match[1]))
-        return(data, conf)
+        return(self.registros.consolidados(mark))
 
     def scrap_seade(self, dados_seade):
-        datas = []
-        conf = []
-        data_mort = []
-        mortes = []
-        acc_conf = 0
-        acc_mort = 0
-        cidade = self.nome
-        for row in dados_seade:
-            if row['nome_munic'] == cidade:
-                data = datetime.datetime.strftime(
-                    datetime.datetime.strptime(row['datahora'],
-                                               "%Y-%m-%d"), "%Y%m%d")
-                if row['casos'] != "NA":
-                    if len(datas) == 0 and int(row['casos']) == 0:
-                        # ignora quando ainda não há casos
-                        pass
-                    else:
-                        datas.append(data)
-                        conf.append(int(row['casos']) - acc_conf)
-                        acc_conf = int(row['casos'])
-                if row['obitos'] != "NA":
-                    if len(data_mort) == 0 and int(row['obitos']) == 0:
-                        pass
-                    else:
-                        morte = int(row['obitos'])
-                        data_mort.append(data)
-                        mortes.append(morte - acc_mort)
-                        acc_mort = morte
+        """ Obtém os dados da cidade a partir do índice da SEADE
+        Parametros:
+        -----------
+        dados_seade: IndiceSeade
+            Dados da SEADE já separados por município (ver `download_seade`)
+        """
+        mun = dados_seade[self.nome]
+        (datas, conf) = novos_seade(mun["datas"], mun["casos"])
+        (data_mort, mortes) = novos_seade(mun["datas"], mun["obitos"])
         return(datas, conf, data_mort, mortes)
 
+    def calcula_series(self):
+        """ Calcula as séries usadas nos gráficos a partir dos dados diários
+
+        As contas são feitas sobre colunas do numpy, guardadas em
+        `self.colunas` (datas em `datetime64[D]` e contagens em `int32`),
+        a partir das colunas de casos de `define_casos`.
+        Os atributos em listas (`dias`, `acc_conf`, `med_conf`, ...) são
+        gerados a partir delas para os gráficos.
+        """
+        self.colunas = {"datas": self.colunas["datas"],
+                        "conf": self.colunas["conf"]}
+        # converte a lista de datas em números,
+        # começando por 0 para graficos
+        self.colunas["dias"] = self.dias_corridos(self.colunas["datas"])
+        self.dias = self.colunas["dias"].tolist()
+        self.dias_mort = self.dias_corridos(self.data_mort).tolist()
+        # calcula o tempo até a primeira morte,
+        # necessário para colocar os gráficos juntos
+        self.diff_morte = abs(int(
+            (converte_datas(self.data_mort[:1])[0] - self.colunas["datas"][0])
+            // np.timedelta64(1, 'D')))
+        with etapa("lacunas", cidade=self.nome):
+            self.completa_dados()  # preenche lacunas nos dados de mortes
+        # calcula os números acumulados
+        with etapa("acumulados", cidade=self.nome):
+            self.colunas["acc_conf"] = self.acumulados(self.colunas["datas"],
+                                                       self.colunas["conf"])
+            self.colunas["acc_mort"] = self.acumulados(self.data_mort,
+                                                       self.mortes)
+        self.acc_conf = self.colunas["acc_conf"].tolist()
+        self.acc_mort = self.colunas["acc_mort"].tolist()
+        # ### desloca eixo x de mortes
+        self.colunas["dias_mort_corr"] = (self.colunas["dias_mort"]
+                                          + self.diff_morte)
+        self.dias_mort_corr = self.colunas["dias_mort_corr"].tolist()
+        # calcula média dos últimos 7 dias
+        with etapa("media", cidade=self.nome):
+            self.colunas["med_conf"] = self.media(self.colunas["dias"],
+                                                  self.colunas["conf"])
+            self.colunas["med_mort"] = self.media(self.colunas["dias_mort"],
+                                                  self.colunas["mortes"])
+        self.med_conf = self.colunas["med_conf"].tolist()
+        self.med_mort = self.colunas["med_mort"].tolist()
+
     def completa_dados(self):
         """ Adiciona valores 0 para datas não reportadas
 
@@ -146,83 +285,52 @@ class Covid:
         Para casos confirmados, deve-se inserir uma entrada com 0 casos novos
         para indicar que não houve novos casos reportados.
         """
-        dias_completo = []
-        data_completo = []
-        mort_completo = []
-        primeiro_dia = datetime.datetime.strptime(self.data_mort[0],
-                                                  "%Y%m%d")
-        um_dia = datetime.timedelta(days=1)
-        for i in range(max(self.dias_mort[-1], self.dias[-1] - self.diff_morte)
-                       + 1):
-            dias_completo.append(i)
-            if i in self.dias_mort:
-                index = self.dias_mort.index(i)
-                data_completo.append(self.data_mort[index])
-                mort_completo.append(self.mortes[index])
-            else:
-                data_completo.append((primeiro_dia
-                                      + i * um_dia).strftime("%Y%m%d"))
-                mort_completo.append(0)
-        self.dias_mort = dias_completo
-        self.data_mort = data_completo
-        self.mortes = mort_completo
+        datas = converte_datas(self.data_mort)
+        dias = self.dias_corridos(datas)
+        total = max(dias[-1], self.dias[-1] - self.diff_morte) + 1
+        mortes = np.zeros(total, dtype=np.int32)
+        mortes[dias] = self.mortes
+        datas = datas[0] + np.arange(total)
+        self.colunas["datas_mort"] = datas
+        self.colunas["dias_mort"] = np.arange(total, dtype=np.int32)
+        self.colunas["mortes"] = mortes
+        self.dias_mort = self.colunas["dias_mort"].tolist()
+        self.data_mort = formata_datas(datas)
+        self.mortes = mortes.tolist()
 
     def acumulados(self, data, conf):
         """ Calcula o total acumulado dos dados
         Parametros:
         -----------
-        data: lista de dias
+        data: lista de dias, sem repetições
         conf: lista de casos
         """
-        dia = data[0]
-        acc = [0]
-        for i in range(len(data)):
-            if data[i] == dia:
-                acc[-1] += conf[i]
-            else:
-                acc.append(acc[-1] + conf[i])
-        return(acc)
+        return(np.cumsum(np.asarray(conf, dtype=np.int32), dtype=np.int32))
 
     def dias_corridos(self, data):
-        """ Converte a lista de datas em uma lista de integers
+        """ Converte a lista de datas em um array de dias desde a primeira
         Parametros:
         -----------
-        data: lista de datas
-        """
-        dias = [0]
-        dia_processado = data[0]
-        dia_conv = datetime.datetime.strptime(dia_processado, "%Y%m%d")
-        for dia in data:
-            if dia != dia_processado:
-                conv = datetime.datetime.strptime(dia, "%Y%m%d")
-                dias.append(abs(conv - dia_conv).days + dias[-1])
-                dia_processado = dia
-                dia_conv = conv
-        return(dias)
+        data: lista de datas (str no formato AAAAMMDD ou datetime64)
+        """
+        data = converte_datas(data)
+        return((data - data[0]).astype(np.int32))
 
     def media(self, dias, dados):
         """ Calcula a média dos últimos 7 dias
+
+        A janela é de 7 dias do calendário e não de 7 pontos, então dias sem
+        dados reportados não entram na conta.
         Parametros:
         -----------
-        dias: lista de inteiros com índices para as datas
+        dias: lista de inteiros com índices para as datas, em ordem crescente
         dados: contagem de casos ou mortes
         """
-        media = [0] * len(dias)
-        for i in range(len(dias)):
-            dia = dias[i]
-            soma = 0
-            count = 0
-            for j in range(7):
-                if i - j >= 0:  # ajuste no início
-                    if dias[i-j] > dia - 7:
-                        # garante que pegas os úlitmos 7 dias e não 7 pontos
-                        soma += dados[i-j]
-                        count += 1
-            if count == 0:
-                count = 1
-            media[i] = soma/count
-        print(media)
-        return(media)
+        dias = np.asarray(dias)
+        soma = np.concatenate(([0], np.cumsum(dados, dtype=np.int64)))
+        fim = np.arange(1, len(dias) + 1)
+        inicio = np.searchsorted(dias, dias - 6, side='left')
+        return((soma[fim] - soma[inicio]) / (fim - inicio))
 
     def plot_acc_conf(self, x, y, cor, datas, ylabel, fig=None, add=False):
         """ Plota o número total de casos
@@ -260,21 +368,10 @@ class Covid:
         ax.set_yscale('log')
         ax.set_ylim(bottom=0.8)
         # altera valores marcados
-        _, max_value = ax.get_ylim()
-        max_value = int(math.ceil(math.log(max_value, 10)))
-        y_ticks = []
-        for i in range(max_value):
-            for j in [1, 2, 3, 5]:
-                y_ticks.append(j * 10 ** i)
-        ax.yaxis.set_major_locator(ticker.FixedLocator(y_ticks))
-        ax.yaxis.set_major_formatter(
-            ticker.FuncFormatter(lambda y, _: '{:g}'.format(y)))
+        corrige_y(ax)
         # ajusta eixo x
-        str_data = []
-        for data in datas:
-            str_data.append(data[6:] + "/" + data[4:6])
         ax.set_xticks(x)
-        ax.set_xticklabels(str_data, rotation=90)
+        ax.set_xticklabels(rotulos_datas(datas), rotation=90)
         # evita que dados fiquem atrás de outros
         ax.set_zorder(10)
         ax.patch.set_visible(False)
@@ -322,11 +419,8 @@ class Covid:
         if add:
             ax.set_ylim(0, max(y)*3)
         else:
-            str_data = []
-            for data in datas:
-                str_data.append(data[6:] + "/" + data[4:6])
             ax.set_xticks(x)
-            ax.set_xticklabels(str_data, rotation=90)
+            ax.set_xticklabels(rotulos_datas(datas), rotation=90)
             # adicionar nota sobre último dia
         # fig.tight_layout()  # otherwise the right y-label is slightly clipped
         return(fig)
@@ -355,39 +449,21 @@ class Covid:
             color = ax.yaxis.label.get_color()
         # definir ticks e posição das linhas relevantes
         # eixo x
-        x_ticks = []
-        x_labels = []
-        vlines_x = []
-        vlines_y = []
-        for i in range(len(x_axis)):
-            if (
-                i == 0
-                or i == len(x_axis) - 1
-                or int(labels[i]) % 100 == 1
-                or int(labels[i]) % 100 == 15
-            ):
-                x_ticks.append(x_axis[i])
-                x_labels.append(labels[i][6:] + '/' + labels[i][4:6])
-                vlines_x.append(x_axis[i])
-                vlines_y.append(y_axis[i])
-                self.datas_marcadas_i.append(x_axis[i])
-                self.datas_marcadas.append(labels[i][6:] + '/'
-                                           + labels[i][4:6])
+        indices = indices_marcados(labels)
+        x_ticks = [x_axis[i] for i in indices]
+        x_labels = rotulos_datas([labels[i] for i in indices])
+        vlines_x = x_ticks
+        vlines_y = [y_axis[i] for i in indices]
+        self.datas_marcadas_i += x_ticks
+        self.datas_marcadas += x_labels
         for x, y in zip(vlines_x, vlines_y):
             label = str(int(y))
-            plt.annotate(label, (x, y), textcoords="offset points",
-                         xytext=(10, -10), ha='center', color=color)
-        plt.xticks(x_ticks, x_labels, rotation=90)
+            ax.annotate(label, (x, y), textcoords="offset points",
+                        xytext=(10, -10), ha='center', color=color)
+        ax.set_xticks(x_ticks)
+        ax.set_xticklabels(x_labels, rotation=90)
         # eixo y
-        _, max_value = ax.get_ylim()
-        max_value = int(math.ceil(math.log(max_value, 10)))
-        y_ticks = []
-        for i in range(max_value):
-            for j in [1, 2, 3, 5]:
-                y_ticks.append(j * 10 ** i)
-        ax.yaxis.set_major_locator(ticker.FixedLocator(y_ticks))
-        ax.yaxis.set_major_formatter(
-            ticker.FuncFormatter(lambda y, _: '{:g}'.format(y)))
+        corrige_y(ax)
         # marcar valores relevantes
         ax.vlines(vlines_x, [0]*len(vlines_x), vlines_y,
                   linestyles='dashed', color='tab:grey', linewidth=1)
@@ -537,163 +613,328 @@ class Covid:
             mais recentes.
         """
         print("Gerando gráficos de casos e óbitos")
-        # GRÁFICOS DE CASOS CONFIRMADOS
-        fig_conf = self.graf_conf()  # gráfico de novos casos
-        fig_acc = self.graf_conf_acc()  # gráfico do total de casos
-        fig_both = self.graf_conf_both()  # gráfico com novos casos e total
-        # GRÁFICOS COM MORTES
-        fig_mort = self.graf_mort()  # gráfico com o número de mortes por dia
-        fig_acc_mort = self.graf_mort_acc()  # gráfico com o total de mortes
-        fig_both_mort = self.graf_mort_both()
-        # GRÁFICO COM CASOS CONFIRMADOS E MORTES
-        fig_all = self.graf_all()
-        # salva figuras
+        with self.renderizador.sessao(show):
+            for grafico in GRAFICOS:
+                self.salva_grafico(grafico, save, atualiza_texto)
+
+    def salva_grafico(self, grafico, save=False, atualiza_texto=False):
+        """ Gera um dos gráficos de `atualiza_graf`, salva-o e libera a figura.
+
+        Parametros:
+        -----------
+        grafico: str
+            Sufixo do gráfico no nome do arquivo (chave de `GRAFICOS`)
+        save: bool
+            Salva o arquivo com a data no nome.
+        atualiza_texto: bool
+            Salva o arquivo **sem** a data no nome.
+        """
+        (metodo, serie) = GRAFICOS[grafico]
         nome = self.nome.replace(' ', '_')
         if self.arquivo:
             sufixo = ""
         else:
             sufixo = "-SEADE"
-        if save:
-            fig_conf.savefig("img/" + self.data[-1] + "-"
-                             + nome + '-novoscasos' + sufixo + '.png')
-            fig_acc.savefig("img/" + self.data[-1] + "-"
-                            + nome + '-totalcasos' + sufixo + '.png')
-            fig_both.savefig("img/" + self.data[-1] + "-" + nome +
-                             '-casosconfirmados' + sufixo + '.png')
-            fig_mort.savefig("img/" + self.data_mort[-1] + "-" + nome
-                             + '-novasmortes' + sufixo + '.png')
-            fig_acc_mort.savefig("img/" + self.data_mort[-1] + "-" + nome
-                                 + '-totalmortes' + sufixo + '.png')
-            fig_both_mort.savefig("img/" + self.data_mort[-1] + "-"
-                                  + nome + '-mortes' + sufixo + '.png')
+        if serie is None:
             data = max(self.data[-1], self.data_mort[-1])
-            fig_all.savefig("img/" + data + "-" + nome + ''
-                            + sufixo + '.png')
+            dados = ("datas", "conf", "datas_mort", "mortes")
+        else:
+            data = getattr(self, serie)[-1]
+            if serie == "data":
+                dados = ("datas", "conf")
+            else:
+                dados = ("datas_mort", "mortes")
+        extensao = self.renderizador.extensao
+        caminhos = []
+        if save:
+            caminhos.append("img/" + data + "-" + nome + grafico
+                            + sufixo + extensao)
         if atualiza_texto:
-            fig_conf.savefig("img/" + nome + '-novoscasos'
-                             + sufixo + '.png')
-            fig_acc.savefig("img/" + nome + '-totalcasos'
-                            + sufixo + '.png')
-            fig_both.savefig("img/" + nome + '-casosconfirmados'
-                             + sufixo + '.png')
-            fig_mort.savefig("img/" + nome + '-novasmortes'
-                             + sufixo + '.png')
-            fig_acc_mort.savefig("img/" + nome + '-totalmortes'
-                                 + sufixo + '.png')
-            fig_both_mort.savefig("img/" + nome + '-mortes'
-                                  + sufixo + '.png')
-            fig_all.savefig("img/" + nome + sufixo + '.png')
-        if show:
-            plt.show()
+            caminhos.append("img/" + nome + grafico + sufixo + extensao)
+        assinatura = self.assinatura(grafico, *[self.colunas[coluna]
+                                                for coluna in dados])
+        if not self.renderizador.precisa(caminhos, assinatura):
+            return(None)
+        with etapa("desenho", cidade=self.nome, grafico=metodo):
+            fig = self.renderizador.desenha(self, metodo)
+        self.renderizador.salva(fig, caminhos, assinatura, self.nome)
+        return(fig)
+
+    def assinatura(self, *dados):
+        """ Hash dos dados usados em um gráfico da cidade (ver
+        `assinatura_dados`)"""
+        return(assinatura_dados(self.nome, self.fonte, *dados))
+
+    def tarefas(self, graficos=None, save=False, atualiza_texto=False,
+                detalhes=False, periodos=(7, 14, 21, 28), proj=28,
+                periodos_detalhes=(), crescimento=()):
+        """ Lista os gráficos da cidade como tarefas para `renderiza_lote`
+
+        Cada tarefa gera e salva um grupo independente de figuras, então elas
+        podem ser executadas em qualquer ordem ou em paralelo.
+        Parametros:
+        -----------
+        graficos: lista de str
+            Gráficos de `GRAFICOS` a serem gerados. Se não for fornecida,
+            gera todos.
+        save, atualiza_texto: bool
+            Mesmo significado de `atualiza_graf`.
+        detalhes: bool
+            Inclui os gráficos de `graf_detalhes`.
+        periodos: lista de int
+            Períodos usados nas projeções de `graf_fit`.
+        proj: int
+            Número de dias projetados.
+        periodos_detalhes: lista
+            Períodos adicionais de `graf_detalhes` (ver `periodo` lá).
+        crescimento: lista de int
+            Períodos dos gráficos de `graf_crescimento`.
+        """
+        if graficos is None:
+            graficos = list(GRAFICOS)
+        tarefas = []
+        for grafico in graficos:
+            tarefas.append((self, "salva_grafico",
+                            {"grafico": grafico, "save": save,
+                             "atualiza_texto": atualiza_texto}))
+        if detalhes:
+            tarefas.append((self, "graf_detalhes", {"salva": True}))
+        for periodo in periodos_detalhes:
+            tarefas.append((self, "graf_detalhes",
+                            {"salva": True, "periodo": periodo}))
+        for periodo in periodos:
+            tarefas.append((self, "graf_fit",
+                            {"periodo": periodo, "proj": proj}))
+        for periodo in crescimento:
+            tarefas.append((self, "graf_crescimento", {"periodo": periodo}))
+        return(tarefas)
+
+    def tabelas(self, periodos=(7, 14, 21, 28)):
+        """ Organiza as séries calculadas em tabelas para exportação
+
+        Retorna um dicionário {nome: colunas}, em que as colunas são um
+        dicionário {nome da coluna: array}, todas ordenadas pela coluna
+        `data` (AAAAMMDD):
+        * `casos`: casos novos, acumulados e média dos últimos 7 dias;
+        * `mortes`: o mesmo para as mortes, com os dias sem dados completos;
+        * `ajustes`: coeficientes das regressões (ver `ajustes`) terminadas
+          em cada data, para casos (`conf`) e mortes (`mort`);
+        * `demografia`: casos, óbitos e recuperados por sexo e idade na data
+          do último caso (apenas para cidades com dados detalhados).
+        """
+        tabelas = {
+            "casos": {"data": np.array(self.data),
+                      "conf": self.colunas["conf"],
+                      "acc_conf": self.colunas["acc_conf"],
+                      "med_conf": self.colunas["med_conf"]},
+            "mortes": {"data": np.array(self.data_mort),
+                       "mortes": self.colunas["mortes"],
+                       "acc_mort": self.colunas["acc_mort"],
+                       "med_mort": self.colunas["med_mort"]}}
+        # ajustes de todos os períodos, em ordem de data
+        ajustes = {"data": [], "tipo": [], "periodo": [], "a": [], "b": [],
+                   "dobro": [], "cresc": []}
+        for periodo, ajuste in self.ajustes(periodos).items():
+            for tipo, datas in (("conf", self.data), ("mort", self.data_mort)):
+                ajustes["data"].append(np.array(datas))
+                ajustes["tipo"].append(np.full(len(datas), tipo))
+                ajustes["periodo"].append(np.full(len(datas), periodo))
+                for chave in ("a", "b", "dobro", "cresc"):
+                    ajustes[chave].append(ajuste[tipo][chave])
+        ajustes = {chave: np.concatenate(valores)
+                   for chave, valores in ajustes.items()}
+        ordem = np.argsort(ajustes["data"], kind='stable')
+        tabelas["ajustes"] = {chave: valores[ordem]
+                              for chave, valores in ajustes.items()}
+        if getattr(self, "det_acc", None) is not None:
+            tabela = self.demografia()
+            (estado, sexo, faixa) = np.indices(tabela.shape).reshape(3, -1)
+            tabelas["demografia"] = {
+                "data": np.full(tabela.size, self.data[-1]),
+                "estado": np.array(["confirmados", "mortes",
+                                    "recuperados"])[estado],
+                "sexo": np.array(SEXOS)[sexo],
+                "faixa": np.array(FAIXAS)[faixa],
+                "quantidade": tabela.ravel()}
+        return(tabelas)
+
+    def exporta(self, destino=DIR_DADOS, formato="csv", modo="substitui",
+                periodos=(7, 14, 21, 28)):
+        """ Grava as tabelas de `tabelas` em arquivos
+
+        Os arquivos são nomeados `<destino>/<cidade>-<tabela>.<formato>`
+        (com `-SEADE` para os dados da SEADE, como nos gráficos).
+        Parametros:
+        -----------
+        destino: str
+            Diretório dos arquivos.
+        formato: str
+            `csv`, `json` (JSON Lines, um objeto por linha) ou `parquet`
+            (requer o pyarrow).
+        modo: str
+            Ver `exporta_tabela`.
+        periodos: lista de int
+            Períodos das regressões exportadas.
+        """
+        print("Exportando dados de " + self.nome)
+        nome = self.nome.replace(' ', '_')
+        if self.arquivo is None:
+            nome += "-SEADE"
+        os.makedirs(destino, exist_ok=True)
+        for tabela, colunas in self.tabelas(periodos).items():
+            with etapa("exporta", cidade=self.nome, tabela=tabela):
+                exporta_tabela(colunas,
+                               os.path.join(destino, nome + "-" + tabela),
+                               formato, modo)
+
+    def __getstate__(self):
+        # os processos de `renderiza_lote` recebem apenas as séries já
+        # calculadas, sem os registros brutos do arquivo de entrada
+        estado = self.__dict__.copy()
+        estado.pop("registros", None)
+        return(estado)
 
     def scrap_pessoal(self, marcador):
-        data = []
-        quant = []
-        sexo = []
-        idade = []
-        re_pad = re.compile("([0-9]{8}) +" + marcador + " +([0-9]+) +"
-                            "([MF-]) +([0-9-]+).*")
-        ent = open(self.arquivo, 'r')
-        dados = ent.read()
-        matches = re.findall(re_pad, dados)
-        for match in matches:
-            if data == []:
-                data.append(match[0])
-                quant.append(int(match[1]))
-                sexo.append(match[2])
-                idade.append(int(match[3]))
-                continue
-            if (match[0] == data[-1] and match[2] == sexo[-1]
-                    and match[3] == idade[-1]):
-                quant[-1] += int(match[1])
-            else:
-                data.append(match[0])
-                quant.append(int(match[1]))
-                sexo.append(match[2])
-                if match[3][0] == "-":
-                    idade.append(-1)
-                else:
-                    idade.append(int(match[3]))
-        return({"data": data, "quant": quant, "sexo": sexo, "idade": idade})
+        """ Retorna os dados detalhados (sexo e idade) de um tipo de registro
+
+        Os registros são retornados como arrays: `data` (datetime64[D]),
+        `quant`, `sexo` (índice em `SEXOS`), `idade` (-1 se não informada) e
+        `faixa` (índice em `FAIXAS`).
+        Parametros:
+        -----------
+        marcador: str
+            Tipo de dado, `P` para novos casos e `M` para mortes.
+        """
+        det = dict(self.registros.detalhados(marcador))
+        det["faixa"] = np.minimum(det["idade"] // 10 + 1,
+                                  len(FAIXAS) - 1).astype(np.int8)
+        return(det)
+
+    def demografia(self, inicio=None, fim=None, dias_rec=14):
+        """ Casos, óbitos e recuperados por sexo e idade em um período
+
+        Calculado em tempo constante a partir das somas acumuladas por dia
+        (`self.det_acc`, ver `acumula_demografia`).
+        São considerados recuperados os casos confirmados no período há mais
+        de `dias_rec` dias em relação ao fim do período, menos os óbitos do
+        período.
+        Retorna um array de dimensões (3, len(SEXOS), len(FAIXAS)) com os
+        casos confirmados, os óbitos e os recuperados.
+        Parametros:
+        -----------
+        inicio, fim: str (AAAAMMDD) ou datetime64
+            Primeiro e último dia do período (inclusive). Sem eles, usa todos
+            os registros, e o último caso confirmado como fim para os
+            recuperados.
+        dias_rec: int
+            Dias após a confirmação para considerar o paciente recuperado.
+        """
+        acc = self.det_acc
+        total = len(acc["conf"]) - 1
+
+        def indice(data):
+            dia = (data - acc["inicio"]) // np.timedelta64(1, 'D')
+            return(int(min(max(dia, 0), total)))
+
+        ini = 0 if inicio is None else indice(data_dia(inicio))
+        if fim is None:
+            fim_i = total
+            fim = self.fim_detalhes()
+        else:
+            fim = data_dia(fim)
+            fim_i = max(indice(fim + 1), ini)
+        rec_i = min(max(indice(fim - np.timedelta64(dias_rec, 'D')), ini),
+                    fim_i)
+        conf = acc["conf"][fim_i] - acc["conf"][ini]
+        mort = acc["mort"][fim_i] - acc["mort"][ini]
+        recu = np.maximum(acc["conf"][rec_i] - acc["conf"][ini] - mort, 0)
+        return(np.stack((conf, mort, recu)))
+
+    def fim_detalhes(self):
+        """ Data do último caso confirmado com sexo e idade
 
-    def graf_detalhes(self, mostra=False, salva=False):
+        Se só houver óbitos detalhados, usa o último dia dos registros.
+        """
+        if len(self.det_conf["data"]):
+            return(self.det_conf["data"][-1])
+        return(self.det_acc["inicio"] + len(self.det_acc["conf"]) - 2)
+
+    def periodo_detalhes(self, periodo):
+        """ Interpreta o período de `graf_detalhes`
+
+        Retorna o início, o fim, o sufixo dos arquivos e o texto dos títulos.
+        """
+        if periodo is None:
+            return(None, None, "", "")
+        if isinstance(periodo, int):
+            fim = self.fim_detalhes()
+            inicio = fim - np.timedelta64(periodo - 1, 'D')
+            return(inicio, fim, "-" + str(periodo) + "d",
+                   " (últimos " + str(periodo) + " dias)")
+        (inicio, fim) = (data_dia(periodo[0]), data_dia(periodo[1]))
+        (txt_inicio, txt_fim) = formata_datas(np.array([inicio, fim]))
+        return(inicio, fim, "-" + txt_inicio + "-" + txt_fim,
+               " (" + txt_inicio[6:] + "/" + txt_inicio[4:6] + " a "
+               + txt_fim[6:] + "/" + txt_fim[4:6] + ")")
+
+    def semanas_epidemiologicas(self):
+        """ Lista as semanas epidemiológicas (domingo a sábado) dos registros
+
+        Retorna uma lista de tuplas (início, fim), que podem ser usadas como
+        `periodo` em `graf_detalhes`.
+        """
+        if self.det_acc is None:
+            return([])
+        primeiro = self.det_acc["inicio"]
+        ultimo = primeiro + len(self.det_acc["conf"]) - 2
+        # 1970-01-01 (dia 0) foi uma quinta-feira
+        dia_semana = (primeiro.astype(np.int64) - 3) % 7
+        inicios = np.arange(primeiro - dia_semana, ultimo + 1,
+                            np.timedelta64(7, 'D'))
+        return([(inicio, inicio + 6) for inicio in inicios])
+
+    def graf_detalhes(self, mostra=False, salva=False, periodo=None):
+        """ Gera os gráficos com os casos por sexo e idade
+
+        Parametros:
+        -----------
+        mostra: bool
+            Exibe os gráficos.
+        salva: bool
+            Salva os gráficos em img/.
+        periodo: int ou tupla
+            Se fornecido, considera apenas os registros dos últimos `periodo`
+            dias, ou entre as datas (início, fim) de uma tupla, como as de
+            `semanas_epidemiologicas`.
+        """
+        if self.det_acc is None:
+            print("Sem dados de sexo e idade em " + self.nome)
+            return
         # initicalização
         print("Gerando gráficos com detalhamento por sexo e idade")
-        idades = np.arange(11)  # mais de 90 na mesma categoria
-        labels = ['-', '0-9', '10-19', '20-29', '30-39', '40-49',
-                  '50-59', '60-69', '70-79', '80-89', '90-']
-        conf_m = [0]*11
-        mort_m = [0]*11
-        recu_m = [0]*11
-        conf_f = [0]*11
-        mort_f = [0]*11
-        recu_f = [0]*11
-        conf_x = [0]*11
-        mort_x = [0]*11
-        recu_x = [0]*11
-        # calcula data para recuperados (14 dias)
-        data = datetime.datetime.strptime(self.det_conf["data"][-1], "%Y%m%d")
-        rec = datetime.timedelta(days=14)
-        data_rec = datetime.datetime.strftime(data - rec, "%Y%m%d")
-        # Separa os casos confirmados or sexo e idade
-        for i in range(len(self.det_conf["data"])):
-            idade = self.det_conf["idade"][i] // 10 + 1
-            if idade > 10:  # mais de 90 anos ficam em um só grupo
-                idade = 10
-            if self.det_conf["sexo"][i] == "M":
-                conf_m[idade] += self.det_conf["quant"][i]
-                if self.det_conf["data"][i] < data_rec:
-                    recu_m[idade] += self.det_conf["quant"][i]
-            elif self.det_conf["sexo"][i] == "F":
-                conf_f[idade] += self.det_conf["quant"][i]
-                if self.det_conf["data"][i] < data_rec:
-                    recu_f[idade] += self.det_conf["quant"][i]
-            else:
-                conf_x[idade] += self.det_conf["quant"][i]
-                if self.det_conf["data"][i] < data_rec:
-                    recu_x[idade] += self.det_conf["quant"][i]
-        # separa os óbitos por sexo e idade
-        for i in range(len(self.det_mort["data"])):
-            idade = self.det_mort["idade"][i] // 10 + 1
-            if idade > 10:
-                idade = 10
-            if self.det_mort["sexo"][i] == "M":
-                mort_m[idade] += self.det_mort["quant"][i]
-                recu_m[idade] -= self.det_mort["quant"][i]
-            elif self.det_mort["sexo"][i] == "F":
-                mort_f[idade] += self.det_mort["quant"][i]
-                recu_f[idade] -= self.det_mort["quant"][i]
-            else:
-                mort_x[idade] += self.det_mort["quant"][i]
-                recu_x[idade] -= self.det_mort["quant"][i]
-        for i in range(len(recu_m)):
-            if recu_m[i] < 0:
-                recu_m[i] = 0
-            if recu_f[i] < 0:
-                recu_f[i] = 0
-            if recu_x[i] < 0:
-                recu_x[i] = 0
-        # calcula os totais de casos
-        tot_conf_m = sum(conf_m)
-        tot_conf_f = sum(conf_f)
-        tot_conf_x = sum(conf_x)
-        tot_conf = tot_conf_m + tot_conf_f + tot_conf_x
-        tot_mort_m = sum(mort_m)
-        tot_mort_f = sum(mort_f)
-        tot_mort_x = sum(mort_x)
-        tot_mort = tot_mort_m + tot_mort_f + tot_mort_x
-        tot_recu_m = sum(recu_m)
-        tot_recu_f = sum(recu_f)
-        tot_recu_x = sum(recu_x)
-        tot_recu = tot_recu_m + tot_recu_f + tot_recu_x
-        # calcula o total por idade
-        conf = [0]*11
-        mort = [0]*11
-        recu = [0]*11
-        for i in range(len(conf_m)):
-            conf[i] = conf_m[i] + conf_f[i] + conf_x[i]
-            mort[i] = mort_m[i] + mort_f[i] + mort_x[i]
-            recu[i] = recu_m[i] + recu_f[i] + recu_x[i]
+        (ini_per, fim_per, sufixo_per, texto_per) = self.periodo_detalhes(
+            periodo)
+        nome = self.nome.replace(' ', '_')
+        sufixos = ['-det-confirmados', '-det-mortes', '-det-recuperados',
+                   '-det-homens', '-det-mulheres', '-det-total']
+        caminhos = []
+        if salva:
+            caminhos = ["img/" + nome + sufixo + sufixo_per
+                        + self.renderizador.extensao for sufixo in sufixos]
+        assinatura = self.assinatura("detalhes", sufixo_per, self.det_conf,
+                                     self.det_mort)
+        if not self.renderizador.precisa(caminhos, assinatura):
+            return
+        inicio = time.perf_counter()
+        idades = np.arange(len(FAIXAS))  # mais de 90 na mesma categoria
+        labels = FAIXAS
+        # separa casos confirmados, óbitos e recuperados por sexo e idade
+        tabela = self.demografia(ini_per, fim_per)
+        ((conf_m, conf_f, conf_x), (mort_m, mort_f, mort_x),
+         (recu_m, recu_f, recu_x)) = tabela.tolist()
+        # calcula o total por idade e os totais de casos
+        (conf, mort, recu) = tabela.sum(axis=1).tolist()
+        (tot_conf, tot_mort, tot_recu) = tabela.sum(axis=(1, 2)).tolist()
         # variáveis para os gráficos
         width = .25
         cor_h = "blue"
@@ -713,7 +954,7 @@ class Covid:
         ax.set_xticks(idades)
         label_temp = []
         for i in range(len(conf)):
-            taxa = int(conf[i]/tot_conf * 100)
+            taxa = porcentagem(conf[i], tot_conf)
             taxa = str(taxa) + "%"
             label_temp.append(labels[i] + '\n' + taxa)
         ax.set_xticklabels(label_temp)
@@ -723,7 +964,7 @@ class Covid:
         ax.set_xlabel("Idade / Prevalência")
         ax.set_ylabel("Número de casos confirmados")
         tit = "Casos confirmados de Coronavírus em "
-        fig_add_title(fig_conf, tit + self.nome)
+        fig_add_title(fig_conf, tit + self.nome + texto_per)
         fig_conf.tight_layout()
         plt.legend()
         # plota gráfico de óbitos por sexo e idade
@@ -737,7 +978,7 @@ class Covid:
         ax.set_xticks(idades)
         label_temp = []
         for i in range(len(conf)):
-            taxa = int(mort[i]/tot_mort * 100)
+            taxa = porcentagem(mort[i], tot_mort)
             taxa = str(taxa) + "%"
             label_temp.append(labels[i] + '\n' + taxa)
         ax.set_xticklabels(label_temp)
@@ -747,7 +988,7 @@ class Covid:
         ax.set_xlabel("Idade / Prevalência")
         ax.set_ylabel("Número de óbitos")
         tit = "Mortes por Coronavírus em "
-        fig_add_title(fig_mort, tit + self.nome)
+        fig_add_title(fig_mort, tit + self.nome + texto_per)
         fig_mort.tight_layout()
         plt.legend()
         # plota gráfico de recuperados por sexo e idade
@@ -761,7 +1002,7 @@ class Covid:
         ax.set_xticks(idades)
         label_temp = []
         for i in range(len(conf)):
-            taxa = int(recu[i]/tot_recu * 100)
+            taxa = porcentagem(recu[i], tot_recu)
             taxa = str(taxa) + "%"
             label_temp.append(labels[i] + '\n' + taxa)
         ax.set_xticklabels(label_temp)
@@ -772,7 +1013,7 @@ class Covid:
         ax.set_xlabel("Idade / Prevalência")
         ax.set_ylabel("Número de recuperados")
         tit = "Pacientes recuperados de Coronavírus em "
-        fig_add_title(fig_recu, tit + self.nome)
+        fig_add_title(fig_recu, tit + self.nome + texto_per)
         fig_recu.tight_layout()
         plt.legend()
         # plota gráfico de homens por idade
@@ -801,7 +1042,7 @@ class Covid:
         ax.set_xlabel("Idade / Mortalidade")
         ax.set_ylabel("Número de pacientes")
         tit = "Estado de Homens com Coronavírus em "
-        fig_add_title(fig_m, tit + self.nome)
+        fig_add_title(fig_m, tit + self.nome + texto_per)
         fig_m.tight_layout()
         plt.legend()
         # plota gráfico de mulheres por idade
@@ -830,7 +1071,7 @@ class Covid:
         ax.set_xlabel("Idade / Mortalidade")
         ax.set_ylabel("Número de pacientes")
         tit = "Estado de Mulheres com Coronavírus em "
-        fig_add_title(fig_f, tit + self.nome)
+        fig_add_title(fig_f, tit + self.nome + texto_per)
         fig_f.tight_layout()
         plt.legend()
         # plota gráfico por idade
@@ -859,66 +1100,93 @@ class Covid:
         ax.set_xlabel("Idade / Mortalidade")
         ax.set_ylabel("Número de pacientes")
         tit = "Estado de Pacientes com Coronavírus em "
-        fig_add_title(fig_t, tit + self.nome)
+        fig_add_title(fig_t, tit + self.nome + texto_per)
         fig_t.tight_layout()
         plt.legend()
 
+        notifica("desenho", time.perf_counter() - inicio, cidade=self.nome,
+                 grafico="graf_detalhes")
         # Salva e mostra as figuras
-        if salva:
-            nome = self.nome.replace(' ', '_')
-            fig_conf.savefig("img/" + nome + '-det-confirmados.png')
-            fig_mort.savefig("img/" + nome + '-det-mortes.png')
-            fig_recu.savefig("img/" + nome + '-det-recuperados.png')
-            fig_m.savefig("img/" + nome + '-det-homens.png')
-            fig_f.savefig("img/" + nome + '-det-mulheres.png')
-            fig_t.savefig("img/" + nome + '-det-total.png')
-        if mostra:
-            plt.show()
+        figuras = [fig_conf, fig_mort, fig_recu, fig_m, fig_f, fig_t]
+        with self.renderizador.sessao(mostra):
+            for i, fig in enumerate(figuras):
+                self.renderizador.salva(fig, caminhos[i:i + 1], assinatura,
+                                        self.nome)
+
+    def ajustes(self, periodos=(7, 14, 21, 28)):
+        """ Regressões y = b.e^ax dos totais de casos e mortes
+
+        Para cada período, calcula a regressão terminada em cada uma das
+        datas, de uma só vez (ver `regressao_movel`).
+        Retorna um dicionário {periodo: {"conf": ..., "mort": ...}}.
+        Parametros:
+        -----------
+        periodos: lista de int
+            Número de dias de cada regressão (-1 para todos os dados).
+        """
+        ajustes = {}
+        for periodo in periodos:
+            janela = None if periodo == -1 else periodo
+            with etapa("regressao", cidade=self.nome, periodo=periodo):
+                ajustes[periodo] = {
+                    "conf": regressao_movel(self.colunas["dias"],
+                                            self.colunas["acc_conf"], janela),
+                    "mort": regressao_movel(self.colunas["dias_mort_corr"],
+                                            self.colunas["acc_mort"], janela)}
+        return(ajustes)
 
-    def fit(self, periodo=-1, proj=28):
-        # filtra dados do últimos n dias
+    def numeros(self, periodo=14):
+        """ Números mais recentes da cidade, usados em `Relatorio`
+
+        Retorna um dicionário com a data mais recente (`data`), os totais
+        (`casos`, `mortes`), as médias dos últimos 7 dias (`media_casos`,
+        `media_mortes`) e os dias para dobrar na regressão de `periodo` dias
+        terminada no último dia (`dobro_casos`, `dobro_mortes`).
+        """
+        ajuste = self.ajustes([periodo])[periodo]
+        return({"data": max(self.data[-1], self.data_mort[-1]),
+                "casos": int(self.colunas["acc_conf"][-1]),
+                "media_casos": float(self.colunas["med_conf"][-1]),
+                "dobro_casos": float(ajuste["conf"]["dobro"][-1]),
+                "mortes": int(self.colunas["acc_mort"][-1]),
+                "media_mortes": float(self.colunas["med_mort"][-1]),
+                "dobro_mortes": float(ajuste["mort"]["dobro"][-1])})
+
+    def fit(self, periodo=-1, proj=28, ajuste=None):
+        """ Gera o gráfico de projeção de casos e mortes
+
+        Parametros:
+        -----------
+        periodo: int
+            Número de dias usados na regressão (-1 para todos os dados).
+        proj: int
+            Número de dias projetados.
+        ajuste: dict
+            Regressões de `ajustes` para o período. Calculadas se omitidas.
+        """
+        if ajuste is None:
+            ajuste = self.ajustes([periodo])[periodo]
+        # coeficientes da regressão terminada no último dia
+        (a_c, b_c, dobro_c, cresc_c) = [ajuste["conf"][chave][-1] for chave
+                                        in ("a", "b", "dobro", "cresc")]
+        (a_m, b_m, dobro_m, cresc_m) = [ajuste["mort"][chave][-1] for chave
+                                        in ("a", "b", "dobro", "cresc")]
+        # dados do últimos n dias
+        inicio = ajuste["conf"]["inicio"][-1]
+        dias = self.dias[inicio:]
+        conf = self.acc_conf[inicio:]
+        inicio = ajuste["mort"]["inicio"][-1]
+        dias_m = self.dias_mort_corr[inicio:]
+        mort = self.acc_mort[inicio:]
         if periodo == -1:
-            dias = self.dias[:]
-            conf = self.acc_conf[:]
-            dias_m = self.dias_mort_corr[:]
-            mort = self.acc_mort[:]
             periodo = len(dias)
-        else:
-            dias = []
-            conf = []
-            dias_m = []
-            mort = []
-            for i in range(len(self.dias)):
-                if self.dias[i] > self.dias[-1] - periodo - 1:
-                    dias.append(self.dias[i])
-                    conf.append(self.acc_conf[i])
-            for i in range(len(self.dias_mort_corr)):
-                if self.dias_mort_corr[i] > (self.dias_mort_corr[-1]
-                                             - periodo - 1):
-                    dias_m.append(self.dias_mort_corr[i])
-                    mort.append(self.acc_mort[i])
-        # regressões  y = b.e^ax
-        (a_c, b_c) = pylab.polyfit(dias, np.log(conf), 1)
-        (a_m, b_m) = pylab.polyfit(dias_m, np.log(mort), 1)
-        # transforma b
-        b_c = math.exp(b_c)
-        b_m = math.exp(b_m)
         # gera dados para plotar regressões
         x = np.linspace(min(max(dias[0] - 3 * (dias[-1] - dias[0]),
                                 self.dias[0]),
                             self.dias[0]),
                         dias[-1] + proj)
-        y_c = []
-        y_m = []
-        for i in x:
-            y_c.append(b_c * math.exp(a_c * i))
-            y_m.append(b_m * math.exp(a_m * i))
-            # gerar datas para marcação
-        # calcula outros dados
-        dobro_c = math.log(2) / a_c
-        dobro_m = math.log(2) / a_m
-        cresc_c = math.exp(a_c * 30)
-        cresc_m = math.exp(a_m * 30)
+        y_c = b_c * np.exp(a_c * x)
+        y_m = b_m * np.exp(a_m * x)
         # plota grafico
         # plota casos confirmados e regresssão
         fig_fit = self.plot_acc_conf(self.dias, self.acc_conf,
@@ -946,7 +1214,7 @@ class Covid:
                 x_tick.append(dias[i])  # para conf e mort
                 x_label.append(gera_data(dias[i], self.dias[-1],
                                          self.data[-1]))
-                vlines_x.append([dias[i]]*2)
+                vlines_x += [dias[i]]*2  # para conf e mort
                 vlines_y.append(conf[i])
                 vlines_y.append(mort[i])
                 plt.annotate(str(int(conf[i])), (dias[i], conf[i]),
@@ -960,9 +1228,9 @@ class Covid:
             x_tick.append(dia)  # para conf e mort
             x_label.append(gera_data(dia, self.dias[-1],
                                      self.data[-1]))
-            vlines_x.append([dia]*2)
-            calc_c = b_c * math.exp(a_c * dia)
-            calc_m = b_m * math.exp(a_m * dia)
+            vlines_x += [dia]*2
+            calc_c = b_c * np.exp(a_c * dia)
+            calc_m = b_m * np.exp(a_m * dia)
             vlines_y.append(calc_c)
             vlines_y.append(calc_m)
             plt.annotate(str(int(calc_c)), (dia, calc_c),
@@ -1028,91 +1296,3019 @@ class Covid:
             periodos = [7, 14, 21, 28]
         else:
             periodos = [periodo]
+        data = max(self.data[-1], self.data_mort[-1])
+        nome = self.nome.replace(' ', '_')
+        if self.arquivo is None:
+            nome += "-SEADE"
+        extensao = self.renderizador.extensao
+        ajustes = None
         for periodo in periodos:
+            caminhos = ["img/" + data + "-" + nome + "-projecao-" +
+                        str(periodo) + "-" + str(proj) + extensao,
+                        "img/" + nome + "-projecao-" +
+                        str(periodo) + "-" + str(proj) + extensao]
+            assinatura = self.assinatura(
+                "projecao", periodo, proj, self.colunas["datas"],
+                self.colunas["conf"], self.colunas["datas_mort"],
+                self.colunas["mortes"])
+            if not self.renderizador.precisa(caminhos, assinatura):
+                continue
+            if ajustes is None:
+                # todas as regressões de uma vez, só se algum gráfico mudou
+                ajustes = self.ajustes(periodos)
             print("Projeção dos últimos " + str(periodo) + " dias")
-            fig = self.fit(periodo, proj)
-            data = max(self.data[-1], self.data_mort[-1])
-            nome = self.nome.replace(' ', '_')
-            if self.arquivo is None:
-                nome += "-SEADE"
-            fig.savefig("img/" + data + "-" + nome + "-projecao-" +
-                        str(periodo) + "-" + str(proj) + ".png")
-            fig.savefig("img/" + nome + "-projecao-" +
-                        str(periodo) + "-" + str(proj) + ".png")
+            with etapa("desenho", cidade=self.nome, grafico="fit",
+                       periodo=periodo):
+                fig = self.fit(periodo, proj, ajustes[periodo])
+            self.renderizador.salva(fig, caminhos, assinatura, self.nome)
 
+    def crescimento(self, periodo=14):
+        """ Histórico do crescimento de casos e mortes
 
-def gera_data(dia, referencia, data):
-    label = datetime.datetime.strptime(data, "%Y%m%d")
-    delta = datetime.timedelta(days=referencia-dia)
-    label = datetime.datetime.strftime(label - delta, "%d/%m")
-    return(label)
+        Para cada dia, usa a regressão dos `periodo` dias anteriores
+        (ver `ajustes`), calculadas todas de uma vez.
+        Retorna um dicionário com as datas (`datas` e `datas_mort`) e, para
+        casos (`_conf`) e mortes (`_mort`), o tempo para dobrar em dias
+        (`dobro`, NaN se não houver crescimento), o crescimento diário em %
+        (`taxa`) e o crescimento em um mês (`cresc`).
+        Parametros:
+        -----------
+        periodo: int
+            Número de dias de cada regressão.
+        """
+        ajuste = self.ajustes([periodo])[periodo]
+        serie = {"datas": self.colunas["datas"],
+                 "datas_mort": self.colunas["datas_mort"]}
+        for chave in ("conf", "mort"):
+            a = ajuste[chave]["a"]
+            with np.errstate(invalid='ignore'):
+                serie["dobro_" + chave] = np.where(a > 0,
+                                                   ajuste[chave]["dobro"],
+                                                   np.nan)
+            serie["taxa_" + chave] = np.expm1(a) * 100
+            serie["cresc_" + chave] = ajuste[chave]["cresc"]
+        return(serie)
 
+    def graf_crescimento(self, periodo=14):
+        """ Gera o gráfico do tempo para dobrar e do crescimento diário
 
-def corrige_y(ax):
-    _, max_value = ax.get_ylim()
-    max_value = int(math.ceil(math.log(max_value, 10)))
-    y_ticks = []
-    for i in range(max_value):
-        for j in [1, 2, 3, 5]:
-            y_ticks.append(j * 10 ** i)
-    ax.yaxis.set_major_locator(ticker.FixedLocator(y_ticks))
-    ax.yaxis.set_major_formatter(
-        ticker.FuncFormatter(lambda y, _: '{:g}'.format(y)))
+        Parametros:
+        -----------
+        periodo: int
+            Número de dias de cada regressão.
+        """
+        print("Gerando histórico de crescimento")
+        data = max(self.data[-1], self.data_mort[-1])
+        nome = self.nome.replace(' ', '_')
+        if self.arquivo is None:
+            nome += "-SEADE"
+        extensao = self.renderizador.extensao
+        caminhos = ["img/" + data + "-" + nome + "-crescimento-" +
+                    str(periodo) + extensao,
+                    "img/" + nome + "-crescimento-" + str(periodo) + extensao]
+        assinatura = self.assinatura(
+            "crescimento", periodo, self.colunas["datas"],
+            self.colunas["conf"], self.colunas["datas_mort"],
+            self.colunas["mortes"])
+        if not self.renderizador.precisa(caminhos, assinatura):
+            return
+        serie = self.crescimento(periodo)
+        with etapa("desenho", cidade=self.nome, grafico="crescimento",
+                   periodo=periodo):
+            fig = plt.figure()
+            (ax_dobro, ax_taxa) = fig.subplots(2, 1, sharex=True)
+            ax_dobro.plot(self.dias, serie["dobro_conf"], color='tab:red',
+                          label="Casos")
+            ax_dobro.plot(self.dias_mort_corr, serie["dobro_mort"],
+                          color='black', label="Mortes")
+            ax_dobro.set_yscale('log')
+            corrige_y(ax_dobro)
+            ax_dobro.yaxis.set_minor_formatter(ticker.NullFormatter())
+            ax_dobro.set_ylabel("Dias para dobrar\n(regressão de "
+                                + str(periodo) + " dias)")
+            ax_dobro.legend(loc="upper left")
+            ax_taxa.plot(self.dias, serie["taxa_conf"], color='tab:red')
+            ax_taxa.plot(self.dias_mort_corr, serie["taxa_mort"],
+                         color='black')
+            ax_taxa.set_ylabel("Crescimento diário (%)")
+            # marca uma data por semana, terminando no último dia
+            x_tick = self.dias[::-7][::-1]
+            x_label = [gera_data(dia, self.dias[-1], self.data[-1])
+                       for dia in x_tick]
+            ax_taxa.set_xticks(x_tick)
+            ax_taxa.set_xticklabels(x_label, rotation=90)
+            ax_dobro.set_title("Crescimento de Casos e Mortes em "
+                               + self.nome)
+            self.fig_add_fonte(fig)
+        self.renderizador.salva(fig, caminhos, assinatura, self.nome)
 
+    def anima(self, caminho, grafico="graf_all", periodo=14, proj=28,
+              quadros_por_segundo=4, dpi=None):
+        """ Grava a evolução de um gráfico dia a dia em uma animação
 
-def autolabel(ax, rects):
-    """Attach a text label above each bar in *rects*, displaying its height."""
-    for rect in rects:
-        height = rect.get_height()
-        ax.annotate('{}'.format(height),
-                    xy=(rect.get_x() + rect.get_width() / 2, height),
-                    xytext=(0, 2),  # 3 points vertical offset
-                    textcoords="offset points",
-                    ha='center', va='bottom')
+        Os quadros são desenhados em uma única figura, com os eixos já nos
+        limites finais; a cada dia apenas os dados são trocados e
+        redesenhados (ver `grava_animacao`).
+        Parametros:
+        -----------
+        caminho: str
+            Arquivo gerado; o formato é dado pela extensão (ver
+            `FORMATOS_ANIMACAO`).
+        grafico: str
+            `graf_all` (casos e mortes) ou `fit` (projeção).
+        periodo, proj: int
+            Período da regressão e número de dias projetados em `fit`.
+        quadros_por_segundo: int
+        dpi: int
+            Resolução dos quadros; se None, usa a da figura (100).
+        """
+        if grafico == "graf_all":
+            (fig, animados, quadro) = self.animacao_total()
+        elif grafico == "fit":
+            (fig, animados, quadro) = self.animacao_projecao(periodo, proj)
+        else:
+            raise ValueError("Gráfico sem animação: " + str(grafico))
+        datas = sorted(set(self.data) | set(self.data_mort))
+        print("Gerando animação com " + str(len(datas)) + " quadros")
+        with etapa("animacao", cidade=self.nome, grafico=grafico,
+                   quadros=len(datas)):
+            grava_animacao(fig, animados, quadro, datas, caminho,
+                           quadros_por_segundo, dpi)
 
+    def animacao_total(self):
+        """ Figura e quadros da animação de `graf_all`
 
-def fig_add_title(fig, title):
-    """ Adiciona um título a figura e ajusta o gráfico na janela"""
-    fig.gca().set_title(title)
-    # fig.tight_layout()  # otherwise the right y-label is slightly clipped
+        Usa um `ModeloTotal` com os dados completos, o que fixa os limites
+        e os rótulos dos eixos, e mostra em cada quadro apenas os dados até
+        a data do quadro. As marcações com os valores são omitidas.
+        Retorna a figura, os artistas redesenhados em cada quadro e a função
+        que os atualiza para uma data.
+        """
+        modelo = ModeloTotal()
+        modelo.atualiza(self)
+        for artista in modelo.anotacoes + [linha for par in modelo.linhas
+                                           for linha in par]:
+            artista.set_visible(False)
+        texto = modelo.fig.text(0, 0, "", fontsize=9,
+                                horizontalalignment='left',
+                                verticalalignment='bottom')
+        # as barras ficam sob os pontos; elas não chegam à legenda, que fica
+        # no fundo, pois ocupam no máximo 1/3 da altura (ver `atualiza`)
+        animados = (modelo.barras[0] + modelo.barras[1] + modelo.medias
+                    + modelo.pontos + [texto])
 
+        def quadro(data):
+            for (i, (acc, _, _, _, media, _, dias, datas)) in enumerate(
+                    ModeloTotal.SERIES):
+                n = bisect.bisect_right(getattr(self, datas), data)
+                x = getattr(self, dias)[:n]
+                modelo.pontos[i].set_offsets(
+                    np.column_stack([x, getattr(self, acc)[:n]]))
+                for j, barra in enumerate(modelo.barras[i]):
+                    barra.set_visible(j < n)
+                modelo.medias[i].set_data(x, getattr(self, media)[:n])
+            texto.set_text(data[6:] + "/" + data[4:6] + "/" + data[:4])
 
-def download_seade():
-    """ Obtem dados atualizados do SEADE"""
-    url = ("https://raw.githubusercontent.com/seade-R/dados-covid-sp/"
-           "master/data/dados_covid_sp.csv")
-    response = urllib.request.urlopen(url)
-    text = response.read()
-    text = str(text, 'utf-8')
-    text = csv.DictReader(text.splitlines(), delimiter=';',
-                          quoting=csv.QUOTE_NONE)
-    return(text)
+        return(modelo.fig, animados, quadro)
 
+    def animacao_projecao(self, periodo=14, proj=28):
+        """ Figura e quadros da animação da projeção (`fit`)
 
-def plt_seade(cidades):
-    for cidade in cidades:
-        dados_seade = download_seade()
-        print("Processando dados de " + cidade)
-        covid = Covid(nome=cidade, dados_seade=dados_seade)
-        fig = covid.graf_all()
-        fig.savefig("img/" + covid.nome.replace(' ', '_') + "-SEADE.png")
-        covid.graf_fit()  # precisa marcar como SEADE no nome do arquivo
+        Em cada quadro são mostrados os totais até a data do quadro e a
+        regressão dos `periodo` dias anteriores, projetada por `proj` dias.
+        Os eixos cobrem todo o período e a projeção a partir do último dia.
+        Retorna o mesmo que `animacao_total`.
+        """
+        ajuste = self.ajustes([periodo])[periodo]
+        fig = figura.Figure()
+        ax = fig.subplots()
+        series = ((self.dias, self.acc_conf, self.data, "conf", "Casos",
+                   'tab:red', 'tab:orange'),
+                  (self.dias_mort_corr, self.acc_mort, self.data_mort, "mort",
+                   "Mortes", 'black', 'tab:blue'))
+        pontos = [ax.scatter([], [], color=serie[5]) for serie in series]
+        curvas = [ax.plot([], [], linestyle='--', color=serie[6])[0]
+                  for serie in series]
+        # eixos fixos: todo o período e a projeção a partir do último dia
+        fim = self.dias[-1] + proj
+        ax.set_xlim(min(self.dias[0], self.dias_mort_corr[0]) - 1, fim + 1)
+        ax.set_yscale('log')
+        ax.set_ylim(0.8, max(self.acc_conf) * 10)
+        corrige_y(ax)
+        ax.yaxis.set_minor_formatter(ticker.NullFormatter())
+        x_tick = list(range(fim, self.dias[0] - 1, -7))[::-1]
+        ax.set_xticks(x_tick)
+        ax.set_xticklabels([gera_data(dia, self.dias[-1], self.data[-1])
+                            for dia in x_tick], rotation=90)
+        ax.set_ylabel("Total de Casos e Mortes")
+        handles = []
+        for serie in series:
+            handles.append(mlines.Line2D([], [], color=serie[5], marker="o",
+                                         linestyle="None",
+                                         label="Total de " + serie[4]))
+            handles.append(mlines.Line2D([], [], color=serie[6],
+                                         linestyle="--",
+                                         label="Projeção de " + serie[4]))
+        ax.legend(handles=handles, loc="upper left")
+        ax.set_title("Projeção de casos e mortes em " + self.nome
+                     + "\nRegressão de " + str(periodo)
+                     + " dias, projeção de " + str(proj) + " dias",
+                     fontsize=10)
+        texto = ax.text(0.98, 0.02, "", fontsize=8, transform=ax.transAxes,
+                        horizontalalignment='right',
+                        verticalalignment='bottom')
+        self.fig_add_fonte(fig)
 
+        def quadro(data):
+            linhas = [data[6:] + "/" + data[4:6] + "/" + data[:4]]
+            for (i, (dias, acc, datas, chave, nome, _, _)) in enumerate(
+                    series):
+                n = bisect.bisect_right(datas, data)
+                pontos[i].set_offsets(np.column_stack([dias[:n], acc[:n]]))
+                a = ajuste[chave]["a"][n - 1] if n else np.nan
+                if not np.isfinite(a):
+                    curvas[i].set_data([], [])
+                    continue
+                x = np.linspace(dias[ajuste[chave]["inicio"][n - 1]],
+                                dias[n - 1] + proj)
+                curvas[i].set_data(x, ajuste[chave]["b"][n - 1]
+                                   * np.exp(a * x))
+                if a > 0:
+                    linhas.append(nome + " dobram em " + "{:.0f}".format(
+                        ajuste[chave]["dobro"][n - 1]) + " dias")
+            texto.set_text("\n".join(linhas))
 
-if __name__ == '__main__':
-    print("Processando dados de Piracicaba.")
-    pir = Covid("Piracicaba.txt")
-    pir.atualiza_graf(save=True, atualiza_texto=True, show=False)
-    pir.graf_detalhes(salva=True, mostra=False)
-    pir.graf_fit()
-    print("Processando dados de Campinas.")
-    camp = Covid("Campinas.txt")
-    camp.atualiza_graf(save=True, atualiza_texto=True, show=False)
-    camp.graf_detalhes(salva=True, mostra=False)
-    camp.graf_fit()
-    print("Atualizando dados do SEADE.")
-    cidades = ["Campinas", "São Paulo", "Piracicaba", "Limeira",
-               "Ribeirão Preto"]
-    plt_seade(cidades)
-    # teste
-    # pir.atualiza_graf(show=True)
+        return(fig, pontos + curvas + [texto], quadro)
+
+
+class ModeloTotal:
+    """ Figura de `Covid.graf_all` reaproveitada entre as cidades
+
+    Montar a figura (eixos, escalas, legenda e os rótulos de cada dia) é a
+    maior parte do tempo de `graf_all`. Aqui isso é feito uma única vez e,
+    para cada cidade, apenas os dados dos pontos, barras, linhas e marcações
+    são trocados, resultando na mesma imagem que `graf_all`.
+    Usado pelo `Renderizador`; a figura não é fechada entre as cidades.
+    """
+    # (acumulado, cor, por dia, cor das barras, média, cor da média, dias,
+    #  datas) dos casos e das mortes
+    SERIES = (("acc_conf", "tab:red", "conf", "tab:blue", "med_conf",
+               "tab:purple", "dias", "data"),
+              ("acc_mort", "black", "mortes", "tab:orange", "med_mort",
+               "tab:brown", "dias_mort_corr", "data_mort"))
+
+    def __init__(self):
+        self.fig = figura.Figure()
+        # totais em escala log
+        self.ax = self.fig.subplots()
+        self.pontos = [self.ax.scatter([], [], color=serie[1])
+                       for serie in self.SERIES]
+        self.linhas = []
+        for _ in self.SERIES:
+            self.linhas.append(
+                (self.ax.vlines([], [], [], linestyles='dashed',
+                                color='tab:grey', linewidth=1),
+                 self.ax.hlines([], [], [], linestyles='dashed',
+                                color='tab:grey', linewidth=1)))
+        self.ax.set_ylabel("Total de Casos e Mortes", color='black')
+        self.ax.tick_params(axis='y', labelcolor='black')
+        self.ax.set_yscale('log')
+        self.ax.set_zorder(10)
+        self.ax.patch.set_visible(False)
+        self.anotacoes = []
+        # valores por dia
+        self.ax_dia = self.ax.twinx()
+        self.barras = [[] for _ in self.SERIES]
+        self.medias = [self.ax_dia.plot([], [], color=serie[5])[0]
+                       for serie in self.SERIES]
+        self.ax_dia.set_ylabel('Novos Casos e Mortes por Dia',
+                               color='tab:orange')
+        self.ax_dia.tick_params(axis='y', labelcolor='tab:orange')
+        self.ax_dia.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+        handles = [mlines.Line2D([], [], color='tab:red', marker="o",
+                                 linestyle="None", label="Total de Casos"),
+                   mlines.Line2D([], [], color='black', marker="o",
+                                 linestyle="None", label="Total de Mortes"),
+                   mpatches.Patch(color='tab:blue', label="Novos Casos"),
+                   mpatches.Patch(color='tab:orange', label="Novas Mortes")]
+        self.ax_dia.legend(handles=handles, loc="upper left")
+        self.fonte = self.fig.text(1, 0, "", fontsize=7,
+                                   horizontalalignment='right',
+                                   verticalalignment='bottom')
+
+    def reserva(self, tamanhos):
+        """ Garante barras suficientes para o número de dias de cada série
+
+        As barras são recriadas todas juntas, na ordem das séries, para que
+        as das mortes continuem sendo desenhadas sobre as dos casos.
+        """
+        if all(len(barras) >= n for barras, n in zip(self.barras, tamanhos)):
+            return
+        for barras in self.barras:
+            for barra in barras:
+                barra.remove()
+        self.barras = [
+            list(self.ax_dia.bar(np.zeros(max(n, len(barras))),
+                                 np.zeros(max(n, len(barras))),
+                                 color=serie[3]).patches)
+            for serie, barras, n in zip(self.SERIES, self.barras, tamanhos)]
+
+    def atualiza(self, covid):
+        """ Troca os dados da figura pelos da cidade e retorna a figura"""
+        ax = self.ax
+        for anotacao in self.anotacoes:
+            anotacao.remove()
+        self.anotacoes = []
+        self.reserva([len(getattr(covid, serie[2]))
+                      for serie in self.SERIES])
+        marcados = {}
+        for (i, (acc, cor, por_dia, _, media, _, dias, datas)) in enumerate(
+                self.SERIES):
+            x = getattr(covid, dias)
+            y = getattr(covid, acc)
+            datas = getattr(covid, datas)
+            self.pontos[i].set_offsets(np.column_stack([x, y]))
+            barras = self.barras[i]
+            for barra, xi, yi in zip(barras, x, getattr(covid, por_dia)):
+                barra.set_x(xi - 0.4)
+                barra.set_height(yi)
+                barra.set_visible(True)
+            for barra in barras[len(x):]:
+                barra.set_visible(False)
+            self.medias[i].set_data(x, getattr(covid, media))
+            # marcações (ver `Covid.marcar_datas`)
+            indices = indices_marcados(datas)
+            self.linhas[i][0].set_segments(
+                [[(x[j], 0), (x[j], y[j])] for j in indices])
+            self.linhas[i][1].set_segments(
+                [[(-10, y[j]), (x[j], y[j])] for j in indices])
+            for j in indices:
+                self.anotacoes.append(
+                    ax.annotate(str(int(y[j])), (x[j], y[j]),
+                                textcoords="offset points", xytext=(10, -10),
+                                ha='center', color=cor))
+                marcados.setdefault(x[j], rotulos_datas([datas[j]])[0])
+        # limite do eixo log calculado apenas com o total de casos, como em
+        # `graf_all`
+        ax.ignore_existing_data_limits = True
+        ax.update_datalim(np.column_stack([covid.dias, covid.acc_conf]))
+        ax.yaxis.set_major_locator(ticker.LogLocator())
+        ax.set_autoscaley_on(True)
+        ax.autoscale_view(scalex=False)
+        ax.set_ylim(bottom=0.8)
+        corrige_y(ax)
+        dias = covid.dias + covid.dias_mort_corr
+        ax.set_xlim(min(dias) - 1, max(dias) + 1)
+        ax.set_xticks(list(marcados))
+        ax.set_xticklabels(list(marcados.values()), rotation=90)
+        self.ax_dia.set_ylim(0, max(covid.conf) * 3)
+        self.ax_dia.set_title("Casos Confirmados e Mortes por Coronavírus em "
+                              + covid.nome)
+        self.fonte.set_text(covid.fonte)
+        self.fig.tight_layout()
+        return(self.fig)
+
+
+MODELOS = {"graf_all": ModeloTotal}
+FORMATOS_IMAGEM = {"png": ".png", "webp": ".webp", "svg": ".svg"}
+
+
+class Renderizador:
+    """ Salva as figuras e libera a memória usada por elas
+
+    Todas as figuras salvas pelos métodos de `Covid` passam por aqui e são
+    fechadas logo depois de salvas, de forma que o número de figuras abertas
+    não cresce com o número de cidades processadas.
+    Dentro de `sessao(mostra=True)` as figuras são mantidas abertas e
+    exibidas ao final.
+
+    Se um `Manifesto` for fornecido, os arquivos gerados são registrados com
+    a assinatura dos dados usados, e `precisa` indica se eles precisam ser
+    refeitos. O manifesto é gravado por `renderiza_lote`; fora dele, é
+    preciso chamar `manifesto.salva()`.
+
+    Os gráficos com um modelo em `MODELOS` são desenhados sempre na mesma
+    figura, criada uma vez por processo (ver `desenha`).
+
+    O formato, a resolução e a compressão dos arquivos valem para todos os
+    gráficos salvos; os caminhos usam a extensão em `extensao`.
+    """
+    def __init__(self, manifesto=None, copia="copia", usa_modelos=True,
+                 formato="png", dpi=None, compressao=None):
+        """
+        Parametros:
+        -----------
+        manifesto: Manifesto
+            Registro dos arquivos já gerados.
+        copia: str
+            Como criar os demais arquivos de uma figura salva em mais de um
+            caminho: `copia` (cópia do arquivo), `link` (hardlink) ou
+            `simbolico` (link simbólico). A figura é codificada uma única vez.
+        usa_modelos: bool
+            Reaproveita as figuras de `MODELOS` entre as cidades.
+        formato: str
+            Formato dos arquivos (chave de `FORMATOS_IMAGEM`). O WebP é
+            gravado sem perdas.
+        dpi: int
+            Resolução dos arquivos; se None, usa a da figura (100).
+        compressao: int
+            Esforço de compressão: de 0 a 9 no PNG (nível do zlib) e de 0 a
+            6 no WebP (`method`). Valores menores são mais rápidos e geram
+            arquivos maiores. Se None, usa o padrão do Pillow.
+        """
+        if copia not in ("copia", "link", "simbolico"):
+            raise ValueError("Modo de cópia inválido: " + str(copia))
+        if formato not in FORMATOS_IMAGEM:
+            raise ValueError("Formato de imagem inválido: " + str(formato))
+        self.mostra = False
+        self.abertas = []
+        self.manifesto = manifesto
+        self.copia = copia
+        self.usa_modelos = usa_modelos
+        self.extensao = FORMATOS_IMAGEM[formato]
+        self.opcoes = {"format": formato}
+        if dpi is not None:
+            self.opcoes["dpi"] = dpi
+        if formato == "png" and compressao is not None:
+            self.opcoes["pil_kwargs"] = {"compress_level": compressao}
+        elif formato == "webp":
+            self.opcoes["pil_kwargs"] = {"lossless": True}
+            if compressao is not None:
+                self.opcoes["pil_kwargs"]["method"] = compressao
+        elif formato == "svg":
+            # sem data e com identificadores fixos: o arquivo só muda se o
+            # gráfico mudar
+            self.opcoes["metadata"] = {"Date": None}
+
+    def contexto(self):
+        """ Configurações do matplotlib usadas ao salvar as figuras"""
+        if self.opcoes["format"] == "svg":
+            return(matplotlib.rc_context({"svg.hashsalt": "covid"}))
+        return(contextlib.nullcontext())
+
+    def assina(self, assinatura):
+        """ Inclui as opções de `savefig` na assinatura de um gráfico
+
+        Com as opções padrão a assinatura não muda, e os manifestos já
+        gravados continuam válidos.
+        """
+        if assinatura is None or self.opcoes == {"format": "png"}:
+            return(assinatura)
+        return(hashlib.sha1((assinatura + repr(sorted(self.opcoes.items())))
+                            .encode()).hexdigest())
+
+    def desenha(self, covid, metodo):
+        """ Gera a figura de um dos métodos `graf_*` da cidade
+
+        Se houver um modelo para o gráfico, apenas os dados da figura do
+        modelo são trocados. As figuras exibidas em `sessao(mostra=True)`
+        são sempre novas.
+        """
+        if self.mostra or not self.usa_modelos or metodo not in MODELOS:
+            return(getattr(covid, metodo)())
+        if metodo not in modelos_abertos:
+            modelos_abertos[metodo] = MODELOS[metodo]()
+        return(modelos_abertos[metodo].atualiza(covid))
+
+    def precisa(self, caminhos, assinatura):
+        """ Indica se a figura precisa ser gerada
+
+        Só não precisa quando há um manifesto e todos os arquivos já existem
+        com a mesma assinatura.
+        """
+        if self.manifesto is None or self.mostra or not caminhos:
+            return(True)
+        return(not self.manifesto.atualizado(caminhos,
+                                             self.assina(assinatura)))
+
+    def salva(self, fig, caminhos, assinatura=None, cidade=None):
+        """ Salva a figura em todos os caminhos e a libera
+
+        A figura é salva no primeiro caminho e os demais são criados a partir
+        dele, de acordo com o modo de cópia.
+        """
+        for i, caminho in enumerate(caminhos):
+            desvincula(caminho)
+            if i == 0:
+                with etapa("savefig", cidade=cidade, arquivo=caminho), \
+                        self.contexto():
+                    fig.savefig(caminho, **self.opcoes)
+            elif self.copia == "simbolico":
+                os.symlink(os.path.relpath(caminhos[0],
+                                           os.path.dirname(caminho)), caminho)
+            elif self.copia == "link":
+                try:
+                    os.link(caminhos[0], caminho)
+                except OSError:  # sistema de arquivos sem suporte a links
+                    shutil.copyfile(caminhos[0], caminho)
+            else:
+                shutil.copyfile(caminhos[0], caminho)
+        if self.manifesto is not None and assinatura is not None:
+            self.manifesto.registra(caminhos, self.assina(assinatura), cidade)
+        if self.mostra:
+            self.abertas.append(fig)
+        elif not any(fig is modelo.fig for modelo in modelos_abertos.values()):
+            plt.close(fig)
+
+    @contextlib.contextmanager
+    def sessao(self, mostra=False):
+        """ Agrupa figuras a serem exibidas juntas ao final do bloco"""
+        if not mostra or self.mostra:
+            yield self
+            return
+        self.mostra = True
+        try:
+            yield self
+            plt.show()
+        finally:
+            self.mostra = False
+            for fig in self.abertas:
+                plt.close(fig)
+            self.abertas = []
+
+    def __getstate__(self):
+        # figuras abertas não são enviadas para outros processos
+        estado = self.__dict__.copy()
+        estado["mostra"] = False
+        estado["abertas"] = []
+        return(estado)
+
+
+class Manifesto:
+    """ Registro dos arquivos gerados e dos dados usados em cada um
+
+    Guardado em um arquivo JSON que associa cada arquivo gerado à assinatura
+    (hash) dos dados e parâmetros do gráfico e ao nome da cidade.
+    Em outros processos (ver `renderiza_lote`) as novas entradas ficam em
+    `novas` e são gravadas pelo processo principal.
+    """
+    def __init__(self, arquivo="img/manifesto.json"):
+        self.arquivo = arquivo
+        self.entradas = {}
+        self.novas = {}
+        self.alterado = False
+        if os.path.exists(arquivo):
+            with open(arquivo, 'r') as ent:
+                self.entradas = json.load(ent)
+
+    def atualizado(self, caminhos, assinatura):
+        """ Indica se todos os arquivos existem e têm a mesma assinatura"""
+        for caminho in caminhos:
+            entrada = self.entradas.get(caminho)
+            if (entrada is None or entrada["assinatura"] != assinatura
+                    or not os.path.exists(caminho)):
+                return(False)
+        return(True)
+
+    def registra(self, caminhos, assinatura, cidade=None):
+        """ Registra os arquivos gerados com a assinatura dos dados"""
+        for caminho in caminhos:
+            entrada = {"assinatura": assinatura, "cidade": cidade}
+            self.entradas[caminho] = entrada
+            self.novas[caminho] = entrada
+
+    def incorpora(self, novas):
+        """ Inclui as entradas registradas em outro processo"""
+        self.entradas.update(novas)
+        self.novas.update(novas)
+
+    def remove(self, caminhos):
+        """ Esquece os arquivos apagados (ver `Acervo`)"""
+        for caminho in caminhos:
+            if self.entradas.pop(caminho, None) is not None:
+                self.alterado = True
+
+    def salva(self):
+        """ Grava o manifesto, se houve mudanças"""
+        if not self.novas and not self.alterado:
+            return
+        with open(self.arquivo + ".tmp", 'w') as saida:
+            json.dump(self.entradas, saida, indent=1, sort_keys=True,
+                      ensure_ascii=False)
+        os.replace(self.arquivo + ".tmp", self.arquivo)
+        self.novas = {}
+        self.alterado = False
+
+
+class Acervo:
+    """ Cópias datadas dos gráficos (`img/AAAAMMDD-<gráfico>`)
+
+    Cada execução com `save=True` grava uma cópia datada de cada gráfico.
+    `compacta` remove as cópias com o mesmo conteúdo de uma anterior e
+    aplica uma política de retenção: todas as cópias dos últimos `dias`,
+    uma por semana nas `semanas` seguintes e uma por mês depois disso.
+    A cópia mais recente de cada gráfico é sempre mantida, assim como os
+    arquivos sem data, que são os usados nas páginas.
+    """
+    RE_DATADO = re.compile(r"(\d{8})-(.+)")
+
+    def __init__(self, diretorio="img", dias=30, semanas=26, meses=None,
+                 manifesto=None):
+        """
+        Parametros:
+        -----------
+        diretorio: str
+            Diretório com as imagens.
+        dias: int
+            Período, em dias, em que todas as cópias são mantidas.
+        semanas: int
+            Período seguinte, em semanas, em que é mantida a última cópia de
+            cada semana.
+        meses: int
+            Período seguinte, em meses de 30 dias, em que é mantida a última
+            cópia de cada mês. Se None, esse período não termina; as cópias
+            mais antigas que ele são removidas.
+        manifesto: Manifesto
+            Se fornecido, os arquivos removidos também saem do manifesto.
+        """
+        self.diretorio = diretorio
+        self.dias = dias
+        self.semanas = semanas
+        self.meses = meses
+        self.manifesto = manifesto
+
+    def graficos(self):
+        """ Agrupa as cópias datadas por gráfico
+
+        Retorna um dicionário com o nome do gráfico (com a extensão) e a
+        lista de (data, caminho) em ordem cronológica.
+        """
+        graficos = {}
+        for nome in sorted(os.listdir(self.diretorio)):
+            encontrado = self.RE_DATADO.fullmatch(nome)
+            if encontrado is None:
+                continue
+            try:
+                data = datetime.datetime.strptime(encontrado.group(1),
+                                                  "%Y%m%d").date()
+            except ValueError:
+                continue
+            graficos.setdefault(encontrado.group(2), []).append(
+                (data, os.path.join(self.diretorio, nome)))
+        return(graficos)
+
+    def periodo(self, data, referencia):
+        """ Grupo da política de retenção ao qual a data pertence
+
+        Apenas a cópia mais recente de cada grupo é mantida. Retorna None
+        se a data é mais antiga que todos os períodos.
+        """
+        idade = (referencia - data).days
+        if idade < self.dias:
+            return(("dia", data))
+        idade -= self.dias
+        if idade < 7 * self.semanas:
+            return(("semana",) + tuple(data.isocalendar()[:2]))
+        idade -= 7 * self.semanas
+        if self.meses is None or idade < 30 * self.meses:
+            return(("mes", data.year, data.month))
+        return(None)
+
+    def planeja(self, referencia=None):
+        """ Lista as cópias a serem removidas, sem alterar nada
+
+        Parametros:
+        -----------
+        referencia: datetime.date
+            Data usada para calcular a idade das cópias. Se None, usa a data
+            mais recente do diretório.
+        Retorna um dicionário com as cópias `duplicadas` e `antigas` de cada
+        gráfico, como listas de (data, caminho).
+        """
+        graficos = self.graficos()
+        if referencia is None and graficos:
+            referencia = max(copias[-1][0] for copias in graficos.values())
+        plano = {}
+        for grafico, copias in graficos.items():
+            duplicadas = []
+            vistos = set()
+            restantes = []
+            for (data, caminho) in copias:
+                conteudo = hash_arquivo(caminho)
+                if conteudo in vistos and data != copias[-1][0]:
+                    duplicadas.append((data, caminho))
+                else:
+                    vistos.add(conteudo)
+                    restantes.append((data, caminho))
+            # a cópia mais recente de cada grupo é mantida
+            antigas = []
+            grupos = {self.periodo(restantes[-1][0], referencia)}
+            for (data, caminho) in reversed(restantes[:-1]):
+                grupo = self.periodo(data, referencia)
+                if grupo is None or grupo in grupos:
+                    antigas.append((data, caminho))
+                else:
+                    grupos.add(grupo)
+            if duplicadas or antigas:
+                plano[grafico] = {"duplicadas": duplicadas,
+                                  "antigas": antigas[::-1]}
+        return(plano)
+
+    def compacta(self, simula=False, prancha=False, referencia=None):
+        """ Remove as cópias duplicadas e as fora da política de retenção
+
+        Parametros:
+        -----------
+        simula: bool
+            Apenas mostra o que seria removido.
+        prancha: bool
+            Antes de remover as cópias antigas de um gráfico, junta-as em uma
+            prancha de miniaturas em `<diretorio>/pranchas/`.
+        referencia: datetime.date
+            Ver `planeja`.
+        Retorna o plano executado (ver `planeja`).
+        """
+        plano = self.planeja(referencia)
+        removidos = []
+        tamanho = 0
+        for grafico, copias in sorted(plano.items()):
+            for tipo in ("duplicadas", "antigas"):
+                for (_, caminho) in copias[tipo]:
+                    print(("Removeria " if simula else "Removendo ")
+                          + tipo[:-1] + ": " + caminho)
+                    tamanho += os.path.getsize(caminho)
+            if simula:
+                continue
+            if prancha and copias["antigas"]:
+                self.prancha(grafico, copias["antigas"])
+            for tipo in ("duplicadas", "antigas"):
+                for (_, caminho) in copias[tipo]:
+                    os.remove(caminho)
+                    removidos.append(caminho)
+        if self.manifesto is not None and removidos:
+            self.manifesto.remove(removidos)
+            self.manifesto.salva()
+        total = sum(len(copias["duplicadas"]) + len(copias["antigas"])
+                    for copias in plano.values())
+        print(str(total) + (" cópias seriam removidas" if simula
+                            else " cópias removidas")
+              + " ({:.1f} MB)".format(tamanho / 2**20))
+        return(plano)
+
+    def prancha(self, grafico, copias, colunas=6):
+        """ Junta as cópias de um gráfico em uma única imagem
+
+        Cada cópia vira uma miniatura com a sua data. As imagens em SVG são
+        ignoradas. Retorna o caminho da prancha, ou None se não houver
+        imagens.
+        """
+        copias = [(data, caminho) for (data, caminho) in copias
+                  if not caminho.endswith(".svg")]
+        if not copias:
+            return(None)
+        linhas = -(-len(copias) // colunas)
+        fig = figura.Figure(figsize=(2.4 * colunas, 1.9 * linhas))
+        eixos = np.atleast_1d(fig.subplots(linhas, colunas)).ravel()
+        for ax in eixos:
+            ax.set_axis_off()
+        for ax, (data, caminho) in zip(eixos, copias):
+            ax.imshow(imagem.imread(caminho))
+            ax.set_title(data.strftime("%d/%m/%Y"), fontsize=8)
+        # margens fixas: `tight_layout` desenharia todas as imagens mais uma
+        # vez
+        fig.subplots_adjust(left=0.01, right=0.99, bottom=0.01,
+                            top=1 - 0.25 / (1.9 * linhas), wspace=0.05,
+                            hspace=0.2)
+        destino = os.path.join(self.diretorio, "pranchas")
+        os.makedirs(destino, exist_ok=True)
+        caminho = os.path.join(
+            destino, os.path.splitext(grafico)[0] + "-"
+            + copias[0][0].strftime("%Y%m%d") + "-"
+            + copias[-1][0].strftime("%Y%m%d") + ".png")
+        fig.savefig(caminho, dpi=80)
+        return(caminho)
+
+
+def assinatura_dados(nome, fonte, *dados):
+    """ Calcula o hash dos dados usados em um gráfico
+
+    Usado pelo manifesto do `Renderizador` para saber se um arquivo já
+    gerado precisa ser refeito. Dicionários entram com os valores em ordem
+    de chave e arrays pelo seu conteúdo.
+    Parametros:
+    -----------
+    nome, fonte: str
+        Nome da cidade (ou do painel) e fonte dos dados
+    dados:
+        Valores dos quais o gráfico depende
+    """
+    sha = hashlib.sha1(repr((VERSAO_GRAFICOS, nome, fonte)).encode())
+    dados = list(dados)
+    while dados:
+        valor = dados.pop(0)
+        if isinstance(valor, dict):
+            dados[:0] = [valor[chave] for chave in sorted(valor)]
+        elif isinstance(valor, np.ndarray):
+            sha.update(np.ascontiguousarray(valor).tobytes())
+        else:
+            sha.update(repr(valor).encode())
+    return(sha.hexdigest())
+
+
+def hash_arquivo(caminho, bloco=2**20):
+    """ Hash SHA-1 do conteúdo de um arquivo"""
+    sha = hashlib.sha1()
+    with open(caminho, 'rb') as ent:
+        for parte in iter(lambda: ent.read(bloco), b""):
+            sha.update(parte)
+    return(sha.hexdigest())
+
+
+FORMATOS_ANIMACAO = [".gif", ".webp", ".mp4"]
+
+
+def grava_animacao(fig, animados, quadro, datas, caminho,
+                   quadros_por_segundo=4, dpi=None):
+    """ Grava uma animação com um quadro por data
+
+    O fundo da figura (eixos, rótulos, título) é desenhado uma única vez;
+    em cada quadro ele é restaurado e apenas os artistas em `animados` são
+    redesenhados, na ordem da lista. Os quadros são enviados ao codificador
+    um a um, sem guardar todas as imagens.
+    GIF e WebP são gravados pelo Pillow; MP4 pelo ffmpeg, que precisa estar
+    instalado. O APNG não é oferecido porque o Pillow percorre os quadros
+    duas vezes ao gravá-lo, o que exigiria guardar todos.
+    Parametros:
+    -----------
+    fig: matplotlib.figure.Figure
+    animados: lista de artistas
+        Artistas alterados por `quadro`.
+    quadro: função
+        Recebe uma data (AAAAMMDD) e atualiza os artistas.
+    datas: lista de str
+        Datas dos quadros, em ordem.
+    caminho: str
+        Arquivo gerado, com uma das extensões de `FORMATOS_ANIMACAO`.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in FORMATOS_ANIMACAO:
+        raise ValueError("Formato de animação inválido: " + extensao)
+    if not datas:
+        raise ValueError("Animação sem quadros")
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    canvas = agg.FigureCanvasAgg(fig)
+    for artista in animados:
+        artista.set_animated(True)
+    canvas.draw()  # desenha apenas o que não é animado
+    fundo = canvas.copy_from_bbox(fig.bbox)
+    (largura, altura) = canvas.get_width_height()
+
+    def quadros():
+        for data in datas:
+            canvas.restore_region(fundo)
+            quadro(data)
+            for artista in animados:
+                fig.draw_artist(artista)
+            yield canvas.buffer_rgba()
+
+    duracao = int(1000 / quadros_por_segundo)
+    if extensao == ".mp4":
+        ffmpeg = shutil.which(matplotlib.rcParams["animation.ffmpeg_path"])
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg não encontrado")
+        processo = subprocess.Popen(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo",
+             "-pix_fmt", "rgba", "-s", str(largura) + "x" + str(altura),
+             "-r", str(quadros_por_segundo), "-i", "-",
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+             caminho], stdin=subprocess.PIPE)
+        try:
+            for buffer in quadros():
+                processo.stdin.write(buffer)
+        finally:
+            processo.stdin.close()
+            if processo.wait() != 0:
+                raise RuntimeError("Erro do ffmpeg ao gravar " + caminho)
+        return
+    imagens = (pillow.frombuffer("RGBA", (largura, altura), bytes(buffer),
+                                 "raw", "RGBA", 0, 1).convert("RGB")
+               for buffer in quadros())
+    opcoes = {"lossless": True}
+    if extensao == ".gif":
+        # uma paleta para todos os quadros, calculada com o último, que tem
+        # todas as cores; calcular uma por quadro é a parte mais lenta
+        quadro(datas[-1])
+        for artista in animados:
+            fig.draw_artist(artista)
+        paleta = pillow.frombuffer("RGBA", (largura, altura),
+                                   canvas.buffer_rgba(), "raw", "RGBA", 0,
+                                   1).convert("RGB").quantize(256)
+        imagens = (imagem.quantize(palette=paleta,
+                                   dither=pillow.Dither.NONE)
+                   for imagem in imagens)
+        opcoes = {}
+    next(imagens).save(caminho, save_all=True, append_images=imagens,
+                       duration=duracao, loop=0, **opcoes)
+
+
+# gráficos das páginas de `Relatorio`, na ordem em que aparecem: seção,
+# expressão que identifica o gráfico pelo nome do arquivo (sem a cidade e a
+# extensão) e legenda, com os grupos da expressão (ver `Relatorio.legenda`)
+GRAFICOS_RELATORIO = [
+    ("Casos e óbitos", r"", "Casos confirmados e mortes"),
+    ("Casos e óbitos", r"-SEADE", "Casos confirmados e mortes (SEADE)"),
+    ("Casos e óbitos", r"-novoscasos", "Novos casos confirmados por dia"),
+    ("Casos e óbitos", r"-totalcasos", "Total de casos confirmados"),
+    ("Casos e óbitos", r"-casosconfirmados",
+     "Novos casos por dia e total de casos"),
+    ("Casos e óbitos", r"-novasmortes", "Mortes por dia"),
+    ("Casos e óbitos", r"-totalmortes", "Total de mortes"),
+    ("Casos e óbitos", r"-mortes", "Mortes por dia e total de mortes"),
+    ("Sexo e idade dos pacientes", r"-det-total(?P<periodo>.*)",
+     "Estado de todos os pacientes"),
+    ("Sexo e idade dos pacientes", r"-det-homens(?P<periodo>.*)",
+     "Estado dos homens infectados"),
+    ("Sexo e idade dos pacientes", r"-det-mulheres(?P<periodo>.*)",
+     "Estado das mulheres infectadas"),
+    ("Sexo e idade dos pacientes", r"-det-confirmados(?P<periodo>.*)",
+     "Casos confirmados por sexo e idade"),
+    ("Sexo e idade dos pacientes", r"-det-recuperados(?P<periodo>.*)",
+     "Pacientes recuperados por sexo e idade"),
+    ("Sexo e idade dos pacientes", r"-det-mortes(?P<periodo>.*)",
+     "Óbitos por sexo e idade"),
+    ("Projeções", r"-projecao-(?P<regressao>\d+)-(?P<proj>\d+)",
+     "Regressão de {regressao} dias, projeção de {proj} dias"),
+    ("Projeções", r"-SEADE-projecao-(?P<regressao>\d+)-(?P<proj>\d+)",
+     "Regressão de {regressao} dias, projeção de {proj} dias (SEADE)"),
+    ("Crescimento", r"-crescimento-(?P<regressao>\d+)",
+     "Tempo para dobrar e crescimento (regressão de {regressao} dias)"),
+    ("Crescimento", r"-SEADE-crescimento-(?P<regressao>\d+)",
+     "Tempo para dobrar e crescimento (regressão de {regressao} dias, "
+     "SEADE)"),
+    ("Comparação entre os municípios",
+     r"-top(?P<n>\d+)-(?P<metrica>[a-z_]+)(?P<opcoes>(-100k)?(-alinhado)?)",
+     "{metrica} nas {n} cidades com maiores valores"),
+    ("Comparação entre os municípios",
+     r"-regioes-(?P<metrica>[a-z_]+)(?P<opcoes>(-100k)?)",
+     "{metrica} por região de SP"),
+]
+
+
+class Relatorio:
+    """ Páginas em Markdown com os números e os gráficos de cada cidade
+
+    Os gráficos de cada cidade são obtidos do manifesto (ver `Manifesto`),
+    então as páginas mostram os arquivos gerados pelas execuções, sem nomes
+    fixos; sem o manifesto, as imagens são procuradas pelo nome. Há uma
+    página por cidade (`<diretorio>/<cidade>.md`), incluindo todos os
+    municípios da SEADE, e um índice (`index.md`) com os números de todas
+    elas.
+    Cada página só é gravada se o seu conteúdo mudou: as páginas das
+    cidades sem dados novos não são tocadas.
+    """
+    def __init__(self, manifesto, diretorio="paginas", periodo=14):
+        """
+        Parametros:
+        -----------
+        manifesto: Manifesto
+            Registro dos gráficos gerados.
+        diretorio: str
+            Diretório das páginas.
+        periodo: int
+            Número de dias da regressão usada no tempo para dobrar.
+        """
+        self.manifesto = manifesto
+        self.diretorio = diretorio
+        self.periodo = periodo
+        self.cidades = {}  # nome: lista de (fonte, números)
+        self.comparacoes = None
+        self.expressoes = [re.compile(expressao) for (_, expressao, _)
+                           in GRAFICOS_RELATORIO]
+
+    def adiciona(self, nome, fonte, numeros):
+        """ Inclui os números de uma cidade (ver `Covid.numeros`)"""
+        self.cidades.setdefault(nome, []).append((fonte, numeros))
+
+    def adiciona_cidade(self, covid):
+        """ Inclui uma cidade lida de um arquivo ou da SEADE"""
+        self.adiciona(covid.nome, covid.fonte[len("Fonte: "):],
+                      covid.numeros(self.periodo))
+
+    def adiciona_seade(self, painel):
+        """ Inclui todos os municípios de um `PainelSeade`
+
+        Os números são calculados de uma só vez para todos eles; os
+        gráficos de comparação do painel vão para o índice.
+        """
+        with etapa("numeros", cidade=painel.nome,
+                   cidades=len(painel.cidades)):
+            numeros = painel.numeros(self.periodo)
+        for cidade, valores in zip(painel.cidades, numeros):
+            self.adiciona(cidade, painel.fonte[len("Fonte: "):], valores)
+        self.comparacoes = painel.nome
+
+    def graficos(self):
+        """ Agrupa os gráficos do manifesto por cidade
+
+        As cópias datadas e os arquivos que não existem mais são ignorados.
+        Se o mesmo gráfico existe em mais de um formato (ver `--imagem`), só
+        o arquivo mais recente é usado. As cidades sem nenhuma entrada no
+        manifesto usam os arquivos encontrados pelo nome (ver
+        `sem_manifesto`).
+        Retorna um dicionário {cidade: [(seção, legenda, caminho)]}, com os
+        gráficos na ordem de `GRAFICOS_RELATORIO`.
+        """
+        candidatos = [(entrada.get("cidade"), caminho) for caminho, entrada
+                      in self.manifesto.entradas.items()]
+        candidatos += self.sem_manifesto({cidade for (cidade, _)
+                                          in candidatos})
+        recentes = {}
+        for (cidade, caminho) in candidatos:
+            if not os.path.exists(caminho):
+                continue
+            chave = (cidade, os.path.splitext(caminho)[0])
+            data = os.path.getmtime(caminho)
+            if chave not in recentes or data > recentes[chave][0]:
+                recentes[chave] = (data, caminho)
+        encontrados = {}
+        for ((cidade, _), (_, caminho)) in recentes.items():
+            arquivo = os.path.splitext(os.path.basename(caminho))[0]
+            prefixo = str(cidade).replace(' ', '_')
+            if (not arquivo.startswith(prefixo)
+                    or Acervo.RE_DATADO.fullmatch(arquivo)):
+                continue
+            for i, expressao in enumerate(self.expressoes):
+                encontrado = expressao.fullmatch(arquivo[len(prefixo):])
+                if encontrado is None:
+                    continue
+                grupos = encontrado.groupdict("")
+                ordem = [int(valor) if valor.isdigit() else valor
+                         for valor in grupos.values()]
+                encontrados.setdefault(cidade, []).append(
+                    ((i, ordem, caminho), (GRAFICOS_RELATORIO[i][0],
+                                           self.legenda(i, grupos),
+                                           caminho)))
+                break
+        return({cidade: [grafico for (_, grafico) in sorted(lista)]
+                for cidade, lista in encontrados.items()})
+
+    def sem_manifesto(self, registradas):
+        """ Gráficos das cidades que não aparecem no manifesto
+
+        As imagens do diretório do manifesto são associadas às cidades pelo
+        nome exato do arquivo: o nome da cidade seguido de uma das chaves de
+        `GRAFICOS_RELATORIO`. Os gráficos da SEADE só são usados se a cidade
+        tem os números da SEADE no relatório.
+        Parametros:
+        -----------
+        registradas: set
+            Cidades com entradas no manifesto, que não são procuradas.
+        Retorna uma lista de (cidade, caminho).
+        """
+        diretorio = os.path.dirname(self.manifesto.arquivo)
+        try:
+            arquivos = sorted(os.listdir(diretorio or "."))
+        except FileNotFoundError:
+            return([])
+        extensoes = set(FORMATOS_IMAGEM.values())
+        nomes = [os.path.splitext(arquivo) for arquivo in arquivos]
+        nomes = [(nome, arquivo) for ((nome, extensao), arquivo)
+                 in zip(nomes, arquivos) if extensao in extensoes]
+        encontrados = []
+        for cidade, fontes in self.cidades.items():
+            if cidade in registradas:
+                continue
+            prefixo = cidade.replace(' ', '_')
+            seade = any(fonte.startswith("SEADE") for (fonte, _) in fontes)
+            expressoes = [expressao for (expressao, (_, chave, _))
+                          in zip(self.expressoes, GRAFICOS_RELATORIO)
+                          if seade or "SEADE" not in chave]
+            encontrados += [(cidade, os.path.join(diretorio, arquivo))
+                            for (nome, arquivo) in nomes
+                            if nome.startswith(prefixo)
+                            and any(expressao.fullmatch(nome[len(prefixo):])
+                                    for expressao in expressoes)]
+        return(encontrados)
+
+    def legenda(self, indice, grupos):
+        """ Legenda do gráfico, com o período dos detalhes e as opções dos
+        gráficos de `PainelSeade`, se houver"""
+        opcoes = grupos.get("opcoes", "")
+        if "metrica" in grupos:
+            metrica = PainelSeade.METRICAS.get(grupos["metrica"],
+                                               grupos["metrica"])
+            if "-100k" in opcoes:
+                metrica += " por 100 mil habitantes"
+            grupos = dict(grupos, metrica=metrica)
+        texto = GRAFICOS_RELATORIO[indice][2].format(**grupos)
+        if "-alinhado" in opcoes:
+            texto += " (alinhados pelo primeiro caso)"
+        periodo = grupos.get("periodo", "")
+        datas = re.fullmatch(r"-(\d{8})-(\d{8})", periodo)
+        if re.fullmatch(r"-\d+d", periodo):
+            texto += " (últimos " + periodo[1:-1] + " dias)"
+        elif datas:
+            (inicio, fim) = datas.groups()
+            texto += (" (" + inicio[6:] + "/" + inicio[4:6] + " a "
+                      + fim[6:] + "/" + fim[4:6] + ")")
+        return(texto)
+
+    def arquivo(self, nome):
+        """ Caminho da página de uma cidade"""
+        return(os.path.join(self.diretorio, nome.replace(' ', '_') + ".md"))
+
+    def secoes(self, graficos):
+        """ Texto dos gráficos, separados por seção"""
+        linhas = []
+        secao = None
+        for (titulo, legenda, caminho) in graficos:
+            if titulo != secao:
+                linhas += ["", "## " + titulo]
+                secao = titulo
+            linhas += ["", legenda + ":  ",
+                       "![" + legenda + "](" + os.path.relpath(
+                           caminho, self.diretorio) + ")"]
+        return(linhas)
+
+    def tabela(self, linhas, primeira="Fonte"):
+        """ Tabela em Markdown com os números de cada linha
+
+        Parametros:
+        -----------
+        linhas: lista de tuplas (texto da primeira coluna, números)
+        """
+        dobro = "Dobram em (" + str(self.periodo) + " dias)"
+        texto = ["| " + primeira + " | Data | Casos | Média (7 dias) | "
+                 + dobro + " | Mortes | Média (7 dias) | " + dobro + " |",
+                 "|---|---|--:|--:|--:|--:|--:|--:|"]
+        for (rotulo, numeros) in linhas:
+            valores = [rotulo, numeros["data"][6:] + "/"
+                       + numeros["data"][4:6] + "/" + numeros["data"][:4]]
+            for tipo in ("casos", "mortes"):
+                dobro = numeros["dobro_" + tipo]
+                valores += [str(numeros[tipo]),
+                            "{:.1f}".format(numeros["media_" + tipo]),
+                            "{:.1f} dias".format(dobro)
+                            if math.isfinite(dobro) and dobro > 0 else "-"]
+            texto.append("| " + " | ".join(valores) + " |")
+        return(texto)
+
+    def pagina(self, nome, graficos):
+        """ Texto da página de uma cidade"""
+        linhas = ["# COVID-19 em " + nome, ""]
+        linhas += self.tabela(self.cidades[nome])
+        linhas += self.secoes(graficos)
+        return("\n".join(linhas) + "\n")
+
+    def indice(self, graficos):
+        """ Texto do índice, com os números de todas as cidades"""
+        linhas = ["# COVID-19 nas cidades de SP", ""]
+        cidades = []
+        for nome, fontes in self.cidades.items():
+            link = "[" + nome + "](" + os.path.basename(
+                self.arquivo(nome)) + ")"
+            cidades += [(link + " (" + fonte + ")", numeros)
+                        for (fonte, numeros) in fontes]
+        linhas += self.tabela(cidades, "Cidade")
+        if self.comparacoes is not None:
+            linhas += self.secoes(graficos.get(self.comparacoes, []))
+        return("\n".join(linhas) + "\n")
+
+    def grava(self):
+        """ Grava as páginas cujo conteúdo mudou
+
+        Retorna o número de páginas gravadas.
+        """
+        os.makedirs(self.diretorio, exist_ok=True)
+        with etapa("relatorio", paginas=len(self.cidades) + 1):
+            graficos = self.graficos()
+            gravadas = grava_se_mudou(os.path.join(self.diretorio,
+                                                   "index.md"),
+                                      self.indice(graficos))
+            for nome in self.cidades:
+                gravadas += grava_se_mudou(
+                    self.arquivo(nome),
+                    self.pagina(nome, graficos.get(nome, [])))
+        print("Páginas: " + str(gravadas) + " gravada(s) e "
+              + str(len(self.cidades) + 1 - gravadas) + " sem mudanças em "
+              + self.diretorio)
+        return(gravadas)
+
+
+def grava_se_mudou(caminho, texto):
+    """ Grava o texto no arquivo apenas se o conteúdo for diferente
+
+    Retorna True se o arquivo foi gravado.
+    """
+    try:
+        with open(caminho, 'r', encoding='utf-8') as ent:
+            if ent.read() == texto:
+                return(False)
+    except FileNotFoundError:
+        pass
+    with open(caminho + ".tmp", 'w', encoding='utf-8') as saida:
+        saida.write(texto)
+    os.replace(caminho + ".tmp", caminho)
+    return(True)
+
+
+FORMATOS = {"csv": ".csv", "json": ".jsonl", "parquet": ".parquet"}
+
+
+def exporta_tabela(colunas, caminho, formato="csv", modo="substitui"):
+    """ Grava uma tabela em CSV, JSON Lines ou Parquet
+
+    Os arquivos são escritos em um temporário e renomeados, de forma que um
+    leitor nunca vê um arquivo pela metade.
+    Parametros:
+    -----------
+    colunas: dict
+        {nome da coluna: array}, ordenadas pela coluna `data` (AAAAMMDD).
+    caminho: str
+        Caminho do arquivo, sem a extensão.
+    formato: str
+        Uma das chaves de `FORMATOS`.
+    modo: str
+        `substitui` grava a tabela inteira; `acrescenta` mantém as linhas já
+        gravadas até a penúltima data do arquivo e refaz as demais, a partir
+        da última data gravada, que pode ter sido exportada incompleta (não
+        disponível em Parquet); `particiona` grava um arquivo por data em
+        `caminho/AAAAMMDD.<formato>`, substituindo apenas os arquivos cujo
+        conteúdo mudou. Valores revistos em datas anteriores à última
+        gravada só são corrigidos no modo `substitui` ou `particiona`.
+    """
+    if formato not in FORMATOS:
+        raise ValueError("Formato inválido: " + str(formato))
+    if formato == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise RuntimeError("O pyarrow é necessário para exportar em Parquet")
+    extensao = FORMATOS[formato]
+    if modo == "substitui":
+        grava_atomico(colunas, caminho + extensao, formato)
+    elif modo == "acrescenta":
+        if formato == "parquet":
+            raise ValueError("Parquet não permite acrescentar linhas, "
+                             "use o modo `particiona`")
+        arquivo = caminho + extensao
+        (ultima, posicao) = ultima_data(arquivo, formato)
+        if ultima is None:
+            grava_atomico(colunas, arquivo, formato)
+            return
+        # copia as linhas anteriores à última data e refaz as seguintes
+        novas = colunas["data"] >= ultima
+        temporario = arquivo + ".tmp"
+        with open(arquivo, 'rb') as ent, open(temporario, 'wb') as saida:
+            while posicao > 0:
+                bloco = ent.read(min(posicao, 1 << 20))
+                saida.write(bloco)
+                posicao -= len(bloco)
+        with open(temporario, 'a', encoding='utf-8', newline='') as saida:
+            escreve_linhas({chave: valores[novas] for chave, valores
+                            in colunas.items()}, saida, formato, False)
+        os.replace(temporario, arquivo)
+    elif modo == "particiona":
+        os.makedirs(caminho, exist_ok=True)
+        datas = colunas["data"]
+        # as linhas de cada data são contíguas
+        (unicas, inicio) = np.unique(datas, return_index=True)
+        fim = np.append(inicio[1:], len(datas))
+        for data, i, j in zip(unicas.tolist(), inicio, fim):
+            grava_atomico({chave: valores[i:j] for chave, valores
+                           in colunas.items()},
+                          os.path.join(caminho, data + extensao), formato,
+                          compara=True)
+    else:
+        raise ValueError("Modo de exportação inválido: " + str(modo))
+
+
+def grava_atomico(colunas, arquivo, formato, compara=False):
+    """ Grava a tabela inteira em um temporário e o renomeia
+
+    Com `compara`, o arquivo existente só é substituído se o conteúdo for
+    diferente. Retorna True se o arquivo foi gravado.
+    """
+    temporario = arquivo + ".tmp"
+    if formato == "parquet":
+        parquet.write_table(pyarrow.table(colunas), temporario)
+    else:
+        with open(temporario, 'w', encoding='utf-8', newline='') as saida:
+            escreve_linhas(colunas, saida, formato, True)
+    if (compara and os.path.exists(arquivo)
+            and filecmp.cmp(temporario, arquivo, shallow=False)):
+        os.remove(temporario)
+        return(False)
+    os.replace(temporario, arquivo)
+    return(True)
+
+
+def escreve_linhas(colunas, saida, formato, cabecalho):
+    """ Escreve as linhas da tabela em CSV ou JSON Lines
+
+    Valores NaN são gravados vazios (CSV) ou como null (JSON).
+    """
+    nomes = list(colunas)
+    valores = []
+    for nome in nomes:
+        coluna = colunas[nome].tolist()
+        if colunas[nome].dtype.kind == 'f':
+            coluna = [None if math.isnan(v) else v for v in coluna]
+        valores.append(coluna)
+    if formato == "csv":
+        escritor = csv.writer(saida, lineterminator='\n')
+        if cabecalho:
+            escritor.writerow(nomes)
+        escritor.writerows(zip(*valores))
+    else:
+        for linha in zip(*valores):
+            saida.write(json.dumps(dict(zip(nomes, linha)),
+                                   ensure_ascii=False) + "\n")
+
+
+def ultima_data(arquivo, formato):
+    """ Data (AAAAMMDD) da última linha de um arquivo exportado e posição
+    (em bytes) da primeira linha com essa data
+
+    Lê apenas o fim do arquivo, dobrando o trecho lido até encontrar uma
+    linha de outra data. Retorna (None, 0) se ele não existir ou não tiver
+    linhas de dados.
+    """
+    if not os.path.exists(arquivo):
+        return(None, 0)
+    with open(arquivo, 'rb') as ent:
+        ent.seek(0, os.SEEK_END)
+        tamanho = ent.tell()
+        bloco = 1024
+        while True:
+            inicio = max(tamanho - bloco, 0)
+            ent.seek(inicio)
+            partes = ent.read().splitlines(keepends=True)
+            posicoes = inicio + np.cumsum([0] + [len(parte) for parte
+                                                 in partes[:-1]])
+            linhas = list(zip(posicoes.tolist(), partes))
+            if inicio > 0:
+                linhas = linhas[1:]  # a primeira pode estar incompleta
+            elif formato == "csv":
+                linhas = linhas[1:]  # cabeçalho
+            linhas = [(posicao, linha) for (posicao, linha) in linhas
+                      if linha.strip()]
+            datas = [data_linha(linha, formato) for (_, linha) in linhas]
+            if datas and (datas[0] != datas[-1] or inicio == 0):
+                break
+            if inicio == 0:
+                return(None, 0)
+            bloco *= 2
+    ultima = datas[-1]
+    primeira = len(datas) - 1
+    while primeira > 0 and datas[primeira - 1] == ultima:
+        primeira -= 1
+    return(ultima, linhas[primeira][0])
+
+
+def data_linha(linha, formato):
+    """ Data (AAAAMMDD) de uma linha em bytes de um arquivo exportado"""
+    linha = linha.decode('utf-8')
+    if formato == "json":
+        return(json.loads(linha)["data"])
+    return(next(csv.reader([linha]))[0])
+
+
+def desvincula(caminho):
+    """ Remove o arquivo se ele for um link
+
+    Evita que, ao escrever um arquivo criado como link por `Renderizador`,
+    o arquivo original também seja alterado.
+    """
+    if os.path.islink(caminho) or (os.path.exists(caminho)
+                                   and os.stat(caminho).st_nlink > 1):
+        os.remove(caminho)
+
+
+def registra_observador(funcao):
+    """ Registra uma função chamada ao final de cada etapa do processamento
+
+    A função recebe o nome da etapa (`leitura`, `seade`, `lacunas`,
+    `acumulados`, `media`, `regressao`, `desenho`, `savefig` ou `perfil`),
+    a duração em segundos e um dicionário com informações como a cidade e o
+    gráfico. Ela é executada no processo que executou a etapa.
+    """
+    observadores.append(funcao)
+    return(funcao)
+
+
+def remove_observador(funcao):
+    """ Remove uma função registrada com `registra_observador`"""
+    observadores.remove(funcao)
+
+
+def notifica(nome, duracao, **info):
+    """ Envia a duração de uma etapa para o logger e os observadores"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %.4f s %s", nome, duracao, info)
+    for funcao in observadores:
+        funcao(nome, duracao, info)
+
+
+@contextlib.contextmanager
+def etapa(nome, **info):
+    """ Mede a duração do bloco e a envia com `notifica`"""
+    inicio = time.perf_counter()
+    try:
+        yield info
+    finally:
+        notifica(nome, time.perf_counter() - inicio, **info)
+
+
+@contextlib.contextmanager
+def perfil(cidade, diretorio=None, memoria=False, tarefa=None):
+    """ Captura o perfil de execução e/ou de memória do bloco
+
+    Parametros:
+    -----------
+    cidade: str
+        Nome usado no arquivo de perfil e nas informações da etapa `perfil`
+    diretorio: str
+        Se fornecido, grava o perfil do cProfile em
+        `diretorio/<cidade>.prof` (pode ser lido com o módulo pstats)
+    memoria: bool
+        Mede o pico de memória com tracemalloc (ver `mede_memoria`)
+    tarefa: str
+        Se fornecido, é acrescentado ao nome do arquivo
+        (`<cidade>-<tarefa>.prof`), para que várias tarefas da mesma cidade
+        não gravem o mesmo arquivo.
+    """
+    info = {"cidade": cidade}
+    if tarefa is not None:
+        info["tarefa"] = tarefa
+    perfilador = None
+    if diretorio is not None:
+        os.makedirs(diretorio, exist_ok=True)
+        perfilador = cProfile.Profile()
+    inicio = time.perf_counter()
+    with contextlib.ExitStack() as pilha:
+        if memoria:
+            pilha.enter_context(mede_memoria(info))
+        if perfilador is not None:
+            perfilador.enable()
+        try:
+            yield info
+        finally:
+            if perfilador is not None:
+                perfilador.disable()
+                nome = cidade if tarefa is None else cidade + "-" + tarefa
+                arquivo = os.path.join(diretorio,
+                                       nome.replace(' ', '_') + ".prof")
+                perfilador.dump_stats(arquivo)
+                info["arquivo"] = arquivo
+    notifica("perfil", time.perf_counter() - inicio, **info)
+
+
+@contextlib.contextmanager
+def mede_memoria(medidas):
+    """ Mede o pico de memória usado dentro do bloco
+
+    Ao final, `medidas` recebe `pico` (maior alocação do Python no bloco, em
+    bytes, via tracemalloc) e `rss` (quanto a memória residente do processo
+    cresceu durante o bloco, em bytes), se ela puder ser lida.
+    """
+    iniciado = not tracemalloc.is_tracing()
+    if iniciado:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    rss_inicio = rss_atual()
+    try:
+        yield medidas
+    finally:
+        medidas["pico"] = tracemalloc.get_traced_memory()[1]
+        if iniciado:
+            tracemalloc.stop()
+        rss_fim = rss_atual()
+        if rss_inicio is not None and rss_fim is not None:
+            medidas["rss"] = max(rss_fim - rss_inicio, 0)
+
+
+def rss_atual():
+    """ Memória residente atual do processo, em bytes
+
+    O `ru_maxrss` do módulo `resource` é o máximo desde o início do
+    processo, que em `renderiza_lote` é compartilhado por várias cidades;
+    por isso a memória atual é lida de /proc. Retorna None se não estiver
+    disponível.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as ent:
+            paginas = int(ent.read().split()[1])
+        return(paginas * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, AttributeError):
+        return(None)
+
+
+class LeitorCasos:
+    """ Lê os arquivos de entrada linha a linha, em uma única passagem
+
+    Cada linha tem o formato
+    `Data   Tipo   Número   Sexo   Idade  ## Observação`
+    e alimenta ao mesmo tempo os dados consolidados por dia (usados por
+    `Covid.scrap`) e os registros detalhados por sexo e idade (usados por
+    `Covid.scrap_pessoal`).
+    O arquivo nunca é carregado inteiro na memória, apenas os dados já
+    processados são mantidos.
+    A posição (em bytes) do fim da última linha lida é guardada, de forma
+    que `continua` processa apenas as linhas acrescentadas depois.
+    Os dados processados podem ser guardados em arquivos binários com
+    `salva` e abertos com `abre` sem ler o texto novamente.
+    """
+    re_data = re.compile("[0-9]{8}$")
+    re_num = re.compile("[0-9]+")
+    re_idade = re.compile("[0-9-]+")
+
+    def __init__(self):
+        self.limpa()
+
+    def limpa(self):
+        """ Descarta todos os dados lidos"""
+        self.cons = {}  # tipo -> (datas, contagens)
+        self.det = {}  # tipo -> {"data", "quant", "sexo", "idade"}
+        self.posicao = 0
+        self.ultima = b""  # última linha lida
+        self.resumo = None  # SHA-1 do trecho já lido, para detectar edições
+        self.salvos = None  # arrays abertos por `abre`
+        self.numero = 0  # número da última linha lida
+        self.problemas = []  # (linha, nível, mensagem, texto)
+        self.anterior = None  # conteúdo da linha anterior
+        self.datas_validas = set()
+
+    def le(self, nome_arquivo):
+        """ Processa todas as linhas do arquivo e retorna o próprio leitor"""
+        self.limpa()
+        self.continua(nome_arquivo)
+        return(self)
+
+    def continua(self, nome_arquivo):
+        """ Processa as linhas acrescentadas desde a última leitura
+
+        Se o arquivo foi editado antes dessa posição (ver `resumo_lido`),
+        todo o arquivo é lido novamente.
+        Retorna True se algum dado mudou.
+        """
+        with etapa("leitura", arquivo=nome_arquivo, inicio=self.posicao):
+            with open(nome_arquivo, 'rb') as ent:
+                sha = self.resumo_lido(ent)
+                mudou = sha is None
+                if mudou:
+                    self.limpa()
+                    sha = hashlib.sha1()
+                elif (self.salvos is not None
+                      and ent.seek(0, os.SEEK_END) > self.posicao):
+                    self.materializa()
+                ent.seek(self.posicao)
+                for linha in ent:
+                    sha.update(linha)
+                    self.posicao += len(linha)
+                    self.ultima = linha
+                    mudou = self.processa(linha.decode()) or mudou
+                self.resumo = sha.hexdigest()
+        return(mudou)
+
+    def resumo_lido(self, ent):
+        """ Calcula o SHA-1 do trecho já lido do arquivo
+
+        Retorna o objeto do hashlib, para continuar com as linhas novas, ou
+        None se o trecho não confere com `resumo` (o arquivo diminuiu, a
+        última linha lida estava incompleta ou alguma linha foi editada,
+        mesmo sem mudar o tamanho do arquivo).
+        """
+        sha = hashlib.sha1()
+        if self.posicao == 0:
+            return(sha)
+        tamanho = ent.seek(0, os.SEEK_END)
+        if tamanho < self.posicao:
+            return(None)
+        if not self.ultima.endswith(b"\n") and tamanho > self.posicao:
+            return(None)  # a última linha lida estava incompleta
+        ent.seek(0)
+        restante = self.posicao
+        while restante > 0:
+            bloco = ent.read(min(restante, 1 << 20))
+            if not bloco:
+                return(None)
+            sha.update(bloco)
+            restante -= len(bloco)
+        if sha.hexdigest() != self.resumo:
+            return(None)
+        return(sha)
+
+    def processa(self, linha):
+        """ Processa uma linha do arquivo de entrada
+
+        Linhas vazias e comentadas com `##` são ignoradas. Linhas fora do
+        formato, com datas inválidas ou fora de ordem, tipos desconhecidos
+        ou sexo e idade inválidos são registradas em `problemas` (ver
+        `problema`).
+        Retorna True se a linha continha um registro.
+        """
+        self.numero += 1
+        (conteudo, _, obs) = linha.partition("##")
+        campos = conteudo.split()
+        if not campos:
+            return(False)
+        num = None
+        if len(campos) >= 3 and self.re_data.match(campos[0]):
+            num = self.re_num.match(campos[2])
+        if num is None:
+            self.problema("erro", "linha fora do formato", linha)
+            return(False)
+        data = campos[0]
+        if data not in self.datas_validas:
+            try:
+                datetime.date(int(data[:4]), int(data[4:6]), int(data[6:]))
+            except ValueError:
+                self.problema("erro", "data inválida", linha)
+                return(False)
+            self.datas_validas.add(data)
+        tipo = campos[1]
+        if tipo not in TIPOS:
+            self.problema("erro", "tipo desconhecido", linha)
+            return(False)
+        quant = int(num.group())
+        # linhas repetidas com a mesma observação são provavelmente cópias
+        chave = (conteudo.split(), obs.strip())
+        if chave[1] and chave == self.anterior:
+            self.problema("aviso", "linha repetida", linha)
+        self.anterior = chave
+        # dados consolidados: soma entradas consecutivas do mesmo dia
+        datas, contagem = self.cons.setdefault(tipo, ([], []))
+        if datas and datas[-1] == data:
+            contagem[-1] += quant
+        else:
+            if datas and data < datas[-1]:
+                self.problema("erro", "data anterior a " + datas[-1], linha)
+            datas.append(data)
+            contagem.append(quant)
+        # dados detalhados: exigem sexo (M, F ou -) e idade (ou --)
+        if len(campos) < 4:
+            return(True)
+        sexo = campos[3]
+        if sexo not in SEXOS:
+            # conta no total, mas não no detalhamento
+            self.problema("aviso", "sexo inválido (" + sexo + ")", linha)
+            return(True)
+        idade = None
+        if len(campos) >= 5:
+            idade = self.re_idade.match(campos[4])
+        if idade is not None:
+            idade = idade.group()
+            if idade[0] == "-":
+                idade = -1
+            elif idade.isdigit():
+                if not self.re_idade.fullmatch(campos[4]):
+                    self.problema("aviso", "idade com caracteres extras",
+                                  linha)
+                idade = int(idade)
+            else:
+                idade = None
+        if idade is None:
+            # conta no total, mas não no detalhamento
+            self.problema("aviso", "idade inválida", linha)
+            return(True)
+        det = self.det.setdefault(tipo, {"data": [], "quant": [],
+                                         "sexo": [], "idade": []})
+        # soma registros consecutivos iguais
+        if (det["data"] and det["data"][-1] == data
+                and det["sexo"][-1] == sexo
+                and det["idade"][-1] == idade):
+            det["quant"][-1] += quant
+        else:
+            det["data"].append(data)
+            det["quant"].append(quant)
+            det["sexo"].append(sexo)
+            det["idade"].append(idade)
+        return(True)
+
+    def problema(self, nivel, mensagem, linha):
+        """ Registra um problema na linha atual
+
+        Parametros:
+        -----------
+        nivel: str
+            `erro` (impede a geração dos gráficos, ver `verifica`) ou `aviso`
+        mensagem: str
+            Descrição do problema
+        linha: str
+            Texto da linha
+        """
+        self.problemas.append((self.numero, nivel, mensagem,
+                               linha.rstrip("\r\n")))
+
+    def verifica(self, nome_arquivo):
+        """ Resume os avisos e lança ErroValidacao se houver erros
+
+        A lista completa é mostrada pelo comando `valida`.
+        """
+        erros = []
+        avisos = {}
+        for (numero, nivel, mensagem, linha) in self.problemas:
+            if nivel == "erro":
+                erros.append(nome_arquivo + ":" + str(numero) + ": "
+                             + mensagem + ": " + linha)
+            else:
+                avisos.setdefault(mensagem, []).append(str(numero))
+        for mensagem, numeros in avisos.items():
+            logger.warning(nome_arquivo + ": " + mensagem + " em "
+                           + str(len(numeros)) + " linha(s): "
+                           + ", ".join(numeros[:5])
+                           + (", ..." if len(numeros) > 5 else ""))
+        if erros:
+            raise ErroValidacao(erros)
+
+    def consolidados(self, tipo):
+        """ Retorna as listas de datas e de contagens diárias de um tipo"""
+        if self.salvos is not None:
+            salvos = self.salvos["cons"].get(tipo)
+            if salvos is None:
+                return([], [])
+            return(formata_datas(salvos["datas"]),
+                   salvos["contagem"].tolist())
+        datas, contagem = self.cons.get(tipo, ([], []))
+        return(datas[:], contagem[:])
+
+    def colunas(self, tipo):
+        """ Retorna as colunas de datas (datetime64[D]) e de contagens
+        diárias (int32) de um tipo
+
+        Se os dados foram abertos com `abre`, são os próprios arrays
+        mapeados do cache, sem cópia (apenas leitura).
+        """
+        if self.salvos is not None and tipo in self.salvos["cons"]:
+            salvos = self.salvos["cons"][tipo]
+            return(salvos["datas"], salvos["contagem"])
+        (datas, contagem) = self.consolidados(tipo)
+        return(converte_datas(datas), np.asarray(contagem, dtype=np.int32))
+
+    def detalhados(self, tipo):
+        """ Retorna os registros detalhados de um tipo
+
+        Os registros são retornados como arrays: `data` (datetime64[D]),
+        `quant`, `sexo` (índice em `SEXOS`) e `idade` (-1 se não informada).
+        Se os dados foram abertos com `abre`, os arrays são apenas leitura.
+        """
+        if self.salvos is not None:
+            if tipo in self.salvos["det"]:
+                return(self.salvos["det"][tipo])
+            det = {"data": [], "quant": [], "sexo": [], "idade": []}
+        else:
+            det = self.det.get(tipo, {"data": [], "quant": [],
+                                      "sexo": [], "idade": []})
+        sexo = np.array(det["sexo"], dtype=str)
+        return({"data": converte_datas(det["data"]),
+                "quant": np.asarray(det["quant"], dtype=np.int32),
+                "sexo": np.select([sexo == "M", sexo == "F"], [0, 1],
+                                  2).astype(np.int8),
+                "idade": np.asarray(det["idade"], dtype=np.int16)})
+
+    def materializa(self):
+        """ Converte os arrays abertos por `abre` nas listas usadas pela
+        leitura, para que novas linhas possam ser processadas"""
+        salvos = self.salvos
+        self.salvos = None
+        for tipo, cons in salvos["cons"].items():
+            self.cons[tipo] = (formata_datas(cons["datas"]),
+                               cons["contagem"].tolist())
+        for tipo, det in salvos["det"].items():
+            self.det[tipo] = {"data": formata_datas(det["data"]),
+                              "quant": det["quant"].tolist(),
+                              "sexo": np.array(SEXOS)[det["sexo"]].tolist(),
+                              "idade": det["idade"].tolist()}
+
+    def salva(self, destino, fonte=None):
+        """ Guarda os dados processados em um diretório
+
+        Cada coluna é um arquivo .npy, que `abre` mapeia na memória. O
+        diretório é substituído por inteiro ao final.
+        Parametros:
+        -----------
+        destino: str
+            Diretório criado
+        fonte: tuple
+            Identificação do arquivo lido (ver `estado_arquivo`)
+        """
+        tipos = sorted(set(self.cons) | set(self.det)
+                       | set(self.salvos["cons"] if self.salvos else ()))
+        temporario = destino + ".tmp"
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+        for tipo in tipos:
+            (datas, contagem) = self.colunas(tipo)
+            colunas = {"cons-datas": datas, "cons-contagem": contagem}
+            for chave, valores in self.detalhados(tipo).items():
+                colunas["det-" + chave] = valores
+            for chave, valores in colunas.items():
+                np.save(os.path.join(temporario, tipo + "-" + chave + ".npy"),
+                        valores)
+        meta = {"versao": VERSAO_CASOS, "tipos": tipos,
+                "posicao": self.posicao, "ultima": self.ultima.decode(),
+                "resumo": self.resumo, "fonte": fonte, "numero": self.numero,
+                "problemas": self.problemas, "anterior": self.anterior}
+        with open(os.path.join(temporario, "meta.json"), 'w') as saida:
+            json.dump(meta, saida)
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporario, destino)
+
+    @classmethod
+    def abre(cls, origem):
+        """ Abre os dados guardados com `salva`, mapeados na memória"""
+        with open(os.path.join(origem, "meta.json"), 'r') as ent:
+            meta = json.load(ent)
+        leitor = cls()
+        leitor.posicao = meta["posicao"]
+        leitor.ultima = meta["ultima"].encode()
+        leitor.resumo = meta["resumo"]
+        leitor.numero = meta["numero"]
+        leitor.problemas = [tuple(problema) for problema in meta["problemas"]]
+        if meta["anterior"] is not None:
+            leitor.anterior = tuple(meta["anterior"])
+        leitor.salvos = {"cons": {}, "det": {}}
+
+        def coluna(tipo, chave):
+            return(np.load(os.path.join(origem, tipo + "-" + chave + ".npy"),
+                           mmap_mode='r'))
+
+        for tipo in meta["tipos"]:
+            leitor.salvos["cons"][tipo] = {
+                "datas": coluna(tipo, "cons-datas"),
+                "contagem": coluna(tipo, "cons-contagem")}
+            leitor.salvos["det"][tipo] = {
+                chave: coluna(tipo, "det-" + chave)
+                for chave in ("data", "quant", "sexo", "idade")}
+        return(leitor)
+
+
+class ErroValidacao(ValueError):
+    """ Erros encontrados na leitura de um arquivo de cidade"""
+    def __init__(self, erros):
+        self.erros = erros
+        texto = "\n".join(erros[:20])
+        if len(erros) > 20:
+            texto += "\n... e mais " + str(len(erros) - 20) + " erros"
+        super().__init__(texto)
+
+
+def carrega_casos(arquivo, cache=DIR_CACHE):
+    """ Lê um arquivo de cidade, usando os dados binários do cache
+
+    Os registros processados ficam em `cache/casos-<arquivo>-<hash>/`, com
+    o hash do caminho absoluto do arquivo (arquivos de mesmo nome em
+    diretórios diferentes não se misturam), junto com o tamanho e a data de
+    modificação do arquivo de texto. Se eles não mudaram, os dados são
+    apenas mapeados na memória; senão o SHA-1 do trecho já lido é
+    conferido: se ele confere, só as linhas novas são lidas (ver
+    `LeitorCasos.continua`), senão o arquivo é lido por inteiro, e o cache
+    é refeito.
+    Parametros:
+    -----------
+    arquivo: str
+        Arquivo de entrada
+    cache: str
+        Diretório do cache. Se None, o arquivo é sempre lido por inteiro.
+    """
+    if cache is None:
+        return(LeitorCasos().le(arquivo))
+    caminho = hashlib.sha1(os.path.abspath(arquivo).encode()).hexdigest()
+    destino = os.path.join(cache, "casos-" + os.path.basename(arquivo)
+                           + "-" + caminho[:12])
+    fonte = list(estado_arquivo(arquivo))
+    leitor = None
+    try:
+        with open(os.path.join(destino, "meta.json"), 'r') as ent:
+            meta = json.load(ent)
+        if meta["versao"] == VERSAO_CASOS:
+            leitor = LeitorCasos.abre(destino)
+    except (OSError, ValueError, KeyError):
+        pass  # cache ausente ou de outra versão
+    if leitor is not None and meta["fonte"] == fonte:
+        return(leitor)
+    if leitor is None:
+        leitor = LeitorCasos().le(arquivo)
+    else:
+        leitor.continua(arquivo)
+    os.makedirs(cache, exist_ok=True)
+    leitor.salva(destino, fonte)
+    return(leitor)
+
+
+def converte_datas(datas):
+    """ Converte datas no formato AAAAMMDD para um array datetime64[D]"""
+    if isinstance(datas, np.ndarray) and datas.dtype.kind == 'M':
+        return(datas.astype('datetime64[D]', copy=False))
+    num = np.asarray(datas, dtype=np.int64)
+    meses = (num // 10000 - 1970) * 12 + num // 100 % 100 - 1
+    return(meses.astype('datetime64[M]').astype('datetime64[D]')
+           + (num % 100 - 1).astype('timedelta64[D]'))
+
+
+def formata_datas(datas):
+    """ Converte um array datetime64[D] em uma lista de str AAAAMMDD"""
+    texto = np.datetime_as_string(datas, unit='D')
+    return(np.char.replace(texto, '-', '').tolist())
+
+
+def rotulos_datas(datas):
+    """ Rótulos dd/mm do eixo x para uma lista de datas AAAAMMDD"""
+    return([data[6:] + "/" + data[4:6] for data in datas])
+
+
+def acumula_demografia(det_conf, det_mort):
+    """ Soma acumulada por dia dos registros detalhados por sexo e idade
+
+    Retorna um dicionário com `inicio` (primeiro dia dos registros), e
+    `conf` e `mort`, arrays de dimensões (dias + 1, len(SEXOS), len(FAIXAS))
+    em que a linha `i` tem o total dos registros anteriores ao dia `i`.
+    Assim, o total de um período é a diferença entre duas linhas.
+    Retorna None se não houver registros detalhados.
+    Parametros:
+    -----------
+    det_conf, det_mort: dict
+        Registros retornados por `Covid.scrap_pessoal`
+    """
+    datas = np.concatenate((det_conf["data"], det_mort["data"]))
+    if len(datas) == 0:
+        return(None)
+    inicio = datas.min()
+    dias = int((datas.max() - inicio) // np.timedelta64(1, 'D')) + 1
+    grupos = len(SEXOS) * len(FAIXAS)
+    acc = {"inicio": inicio}
+    for chave, det in (("conf", det_conf), ("mort", det_mort)):
+        dia = (det["data"] - inicio) // np.timedelta64(1, 'D')
+        # um único bincount sobre o índice combinado (dia, sexo, faixa)
+        indice = (dia * grupos + det["sexo"].astype(np.intp) * len(FAIXAS)
+                  + det["faixa"])
+        soma = np.bincount(indice, weights=det["quant"],
+                           minlength=dias * grupos)
+        soma = soma.round().astype(np.int64).reshape(dias, len(SEXOS),
+                                                     len(FAIXAS))
+        acc[chave] = np.concatenate((np.zeros((1, len(SEXOS), len(FAIXAS)),
+                                              dtype=np.int64),
+                                     np.cumsum(soma, axis=0)))
+    return(acc)
+
+
+def data_dia(data):
+    """ Converte uma data (str AAAAMMDD, date ou datetime64) em datetime64[D]
+    """
+    if isinstance(data, str):
+        return(converte_datas([data])[0])
+    return(np.datetime64(data, 'D'))
+
+
+def porcentagem(parte, total):
+    """ Porcentagem inteira de `parte` em `total` (0 se o total for 0)"""
+    if total == 0:
+        return(0)
+    return(int(parte / total * 100))
+
+
+def regressao_movel(x, y, periodo=None):
+    """ Regressões y = b.e^ax terminadas em cada ponto da série
+
+    A regressão linear de log(y) é calculada em forma fechada a partir de
+    somas acumuladas de x, log(y), x.log(y) e x², de forma que todas as
+    janelas são obtidas de uma só vez. `y` pode ter duas dimensões (uma
+    série por linha, por exemplo uma por cidade), com `x` em comum.
+    Pontos com y <= 0 são ignorados; janelas com menos de dois pontos
+    resultam em NaN.
+    Retorna um dicionário com os arrays `a`, `b`, `dobro` (dias para dobrar),
+    `cresc` (crescimento em 30 dias) e `inicio` (índice do primeiro ponto de
+    cada janela).
+    Parametros:
+    -----------
+    x: array
+        Dias, em ordem crescente
+    y: array
+        Valores acumulados
+    periodo: int
+        A janela terminada em x[i] contém os pontos com
+        x > x[i] - periodo - 1. Se None, usa todos os pontos até x[i].
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if periodo is None:
+        inicio = np.zeros(len(x), dtype=np.intp)
+    else:
+        inicio = np.searchsorted(x, x - periodo - 1, side='right')
+    fim = np.arange(1, len(x) + 1)
+    # x relativo ao último dia reduz os erros de arredondamento das somas
+    referencia = x[-1] if len(x) else 0
+    x = x - referencia
+    validos = y > 0
+    peso = validos.astype(np.float64)
+    log_y = np.log(np.where(validos, y, 1))
+
+    def janela(valores):
+        acc = np.cumsum(valores, axis=-1)
+        acc = np.concatenate((np.zeros(acc.shape[:-1] + (1,)), acc), axis=-1)
+        return(acc[..., fim] - acc[..., inicio])
+
+    n = janela(peso)
+    s_x = janela(peso * x)
+    s_y = janela(peso * log_y)
+    s_xy = janela(peso * x * log_y)
+    s_xx = janela(peso * x * x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = (n * s_xy - s_x * s_y) / (n * s_xx - s_x * s_x)
+        a[n < 2] = np.nan
+        log_b = (s_y - a * s_x) / n - a * referencia
+        return({"a": a, "b": np.exp(log_b), "dobro": np.log(2) / a,
+                "cresc": np.exp(a * 30), "inicio": inicio})
+
+
+def gera_data(dia, referencia, data):
+    label = datetime.datetime.strptime(data, "%Y%m%d")
+    delta = datetime.timedelta(days=referencia-dia)
+    label = datetime.datetime.strftime(label - delta, "%d/%m")
+    return(label)
+
+
+def indices_marcados(datas):
+    """ Índices das datas marcadas nos gráficos
+
+    São marcados o primeiro e o último dia, e os dias 1 e 15 de cada mês.
+    """
+    return([i for i, data in enumerate(datas)
+            if i == 0 or i == len(datas) - 1 or data[6:] in ("01", "15")])
+
+
+def corrige_y(ax):
+    """ Marca os valores 1, 2, 3 e 5 de cada potência de 10 no eixo y
+
+    Usado nos gráficos em escala log, até o limite superior atual do eixo.
+    """
+    _, max_value = ax.get_ylim()
+    max_value = int(math.ceil(math.log(max_value, 10)))
+    y_ticks = []
+    for i in range(max_value):
+        for j in [1, 2, 3, 5]:
+            y_ticks.append(j * 10 ** i)
+    ax.yaxis.set_major_locator(ticker.FixedLocator(y_ticks))
+    ax.yaxis.set_major_formatter(
+        ticker.FuncFormatter(lambda y, _: '{:g}'.format(y)))
+
+
+def autolabel(ax, rects):
+    """Attach a text label above each bar in *rects*, displaying its height."""
+    for rect in rects:
+        height = rect.get_height()
+        ax.annotate('{}'.format(height),
+                    xy=(rect.get_x() + rect.get_width() / 2, height),
+                    xytext=(0, 2),  # 3 points vertical offset
+                    textcoords="offset points",
+                    ha='center', va='bottom')
+
+
+def fig_add_title(fig, title):
+    """ Adiciona um título a figura e ajusta o gráfico na janela"""
+    fig.gca().set_title(title)
+    # fig.tight_layout()  # otherwise the right y-label is slightly clipped
+
+
+class IndiceSeade:
+    """ Dados da SEADE separados por município
+
+    O arquivo CSV é processado uma única vez e as colunas de datas, casos e
+    óbitos acumulados são guardadas em arrays ordenados por município, de
+    forma que obter os dados de uma cidade é apenas um recorte dos arrays.
+    Valores ausentes (`NA`) são guardados como -1.
+    A população (`pop`) e a região de saúde (`regioes`, coluna `nome_drs`)
+    de cada município também são guardadas, se presentes no CSV.
+    """
+    def __init__(self, nomes, inicio, datas, casos, obitos, pop=None,
+                 regioes=None):
+        self.nomes = list(nomes)
+        self.inicio = inicio
+        self.datas = datas
+        self.casos = casos
+        self.obitos = obitos
+        if pop is None:
+            pop = np.full(len(self.nomes), -1, dtype=np.int64)
+        if regioes is None:
+            regioes = [""] * len(self.nomes)
+        self.pop = pop
+        self.regioes = list(regioes)
+        self.posicao = {nome: i for i, nome in enumerate(self.nomes)}
+
+    def __contains__(self, nome):
+        return(nome in self.posicao)
+
+    def __getitem__(self, nome):
+        i = self.posicao[nome]
+        fatia = slice(self.inicio[i], self.inicio[i + 1])
+        return({"datas": self.datas[fatia], "casos": self.casos[fatia],
+                "obitos": self.obitos[fatia]})
+
+    def municipios(self):
+        """ Lista os municípios presentes nos dados"""
+        return(self.nomes[:])
+
+    def salva(self, destino):
+        """ Salva o índice em um arquivo binário do numpy (.npz)"""
+        with open(destino, 'wb') as saida:
+            np.savez(saida, nomes=np.array(self.nomes), inicio=self.inicio,
+                     datas=self.datas, casos=self.casos, obitos=self.obitos,
+                     pop=self.pop, regioes=np.array(self.regioes))
+
+    @classmethod
+    def abre(cls, origem):
+        """ Carrega um índice salvo com `salva`"""
+        with np.load(origem) as dados:
+            # índices salvos por versões anteriores não têm pop e regioes
+            (pop, regioes) = (None, None)
+            if "pop" in dados.files:
+                pop = dados["pop"]
+                regioes = dados["regioes"].tolist()
+            return(cls(dados["nomes"].tolist(), dados["inicio"],
+                       dados["datas"], dados["casos"], dados["obitos"],
+                       pop, regioes))
+
+
+def indexa_seade(linhas):
+    """ Processa as linhas do CSV da SEADE e cria o índice por município
+    Parametros:
+    -----------
+    linhas: iterável de str
+        Linhas do arquivo, incluindo o cabeçalho
+    """
+    leitor = csv.reader(linhas, delimiter=';', quoting=csv.QUOTE_NONE)
+    cabecalho = next(leitor)
+    col_nome = cabecalho.index('nome_munic')
+    col_data = cabecalho.index('datahora')
+    col_casos = cabecalho.index('casos')
+    col_obitos = cabecalho.index('obitos')
+    # colunas opcionais
+    col_pop = cabecalho.index('pop') if 'pop' in cabecalho else None
+    col_drs = cabecalho.index('nome_drs') if 'nome_drs' in cabecalho else None
+    nomes = []
+    datas = []
+    casos = []
+    obitos = []
+    pop = []
+    regioes = []
+    for row in leitor:
+        if not row:
+            continue
+        nomes.append(row[col_nome])
+        datas.append(row[col_data])
+        casos.append(row[col_casos])
+        obitos.append(row[col_obitos])
+        if col_pop is not None:
+            pop.append(row[col_pop])
+        if col_drs is not None:
+            regioes.append(row[col_drs])
+    unicos, cod = np.unique(np.array(nomes), return_inverse=True)
+    ordem = np.argsort(cod, kind='stable')  # mantém a ordem das linhas
+    inicio = np.concatenate(([0], np.cumsum(np.bincount(
+        cod, minlength=len(unicos)))))
+    # população e região de cada município, da sua última linha
+    ultimas = ordem[inicio[1:] - 1]
+    if col_pop is not None:
+        pop = np.where(np.array(pop) == "", "NA", pop)
+        pop = converte_na(pop[ultimas])
+    else:
+        pop = None
+    if col_drs is not None:
+        regioes = np.array(regioes)[ultimas].tolist()
+    else:
+        regioes = None
+    return(IndiceSeade(unicos.tolist(), inicio,
+                       np.array(datas, dtype='datetime64[D]')[ordem],
+                       converte_na(casos)[ordem],
+                       converte_na(obitos)[ordem], pop, regioes))
+
+
+class PainelSeade:
+    """ Séries de vários municípios da SEADE em matrizes (cidade x dia)
+
+    Os totais de casos e óbitos de todas as cidades ficam em arrays de duas
+    dimensões sobre o mesmo calendário, de forma que comparações (curvas
+    alinhadas pelo primeiro caso, taxas por 100 mil habitantes, rankings e
+    agrupamentos por região) são feitas sem criar um `Covid` por cidade.
+    Dias sem dados repetem o último total conhecido.
+    """
+    METRICAS = {"casos": "Total de Casos", "obitos": "Total de Mortes",
+                "casos_novos": "Novos Casos por Dia",
+                "obitos_novos": "Novas Mortes por Dia"}
+
+    def __init__(self, dados_seade, cidades=None, renderizador=None):
+        """
+        Parametros:
+        -----------
+        dados_seade: IndiceSeade
+            Dados obtidos com `download_seade`.
+        cidades: lista de str
+            Municípios incluídos. Se não for fornecida, inclui todos.
+        renderizador: Renderizador
+            responsável por salvar e liberar as figuras.
+        """
+        if renderizador is None:
+            renderizador = Renderizador()
+        self.renderizador = renderizador
+        self.nome = "SEADE"
+        self.fonte = "Fonte: SEADE/SP"
+        if cidades is None:
+            cidades = [cidade for cidade in dados_seade.municipios()
+                       if cidade != "Ignorado"]
+        self.cidades = list(cidades)
+        pos = np.array([dados_seade.posicao[cidade] for cidade in cidades],
+                       dtype=np.intp)
+        self.pop = dados_seade.pop[pos]
+        self.regioes = [dados_seade.regioes[i] for i in pos]
+        # linhas do índice de cada cidade, concatenadas
+        tamanhos = dados_seade.inicio[pos + 1] - dados_seade.inicio[pos]
+        deslocamento = np.repeat(dados_seade.inicio[pos]
+                                 - np.cumsum(tamanhos) + tamanhos, tamanhos)
+        linhas = deslocamento + np.arange(tamanhos.sum())
+        cidade = np.repeat(np.arange(len(pos)), tamanhos)
+        datas = dados_seade.datas[linhas]
+        self.datas = np.arange(datas.min(), datas.max() + 1)
+        dia = (datas - self.datas[0]) // np.timedelta64(1, 'D')
+        self.series = {}
+        for chave, valores in (("casos", dados_seade.casos),
+                               ("obitos", dados_seade.obitos)):
+            matriz = np.full((len(pos), len(self.datas)), -1, dtype=np.int64)
+            matriz[cidade, dia] = valores[linhas]
+            self.series[chave] = preenche_matriz(matriz)
+
+    def serie(self, metrica="casos", por_habitante=False):
+        """ Matriz (cidade x dia) de uma métrica
+
+        Parametros:
+        -----------
+        metrica: str
+            Uma das chaves de `METRICAS`.
+        por_habitante: bool
+            Divide pela população, em casos por 100 mil habitantes (NaN se a
+            população não for conhecida).
+        """
+        if metrica not in self.METRICAS:
+            raise ValueError("Métrica inválida: " + str(metrica))
+        if metrica.endswith("_novos"):
+            valores = np.diff(self.series[metrica[:-6]], axis=1, prepend=0)
+        else:
+            valores = self.series[metrica]
+        if por_habitante:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                valores = np.where(self.pop[:, None] > 0,
+                                   valores * 1e5 / self.pop[:, None], np.nan)
+        return(valores)
+
+    def alinhados(self, metrica="casos", por_habitante=False, limiar=1):
+        """ Matriz (cidade x dia) com as curvas alinhadas pelo primeiro caso
+
+        A coluna `i` tem o valor de cada cidade `i` dias após o dia em que
+        ela atingiu `limiar` casos; depois do último dia, e para cidades que
+        não atingiram o limiar, os valores são NaN.
+        """
+        valores = self.serie(metrica, por_habitante).astype(np.float64)
+        atingiu = self.series["casos"] >= limiar
+        primeiro = np.where(atingiu.any(axis=1), atingiu.argmax(axis=1),
+                            len(self.datas))
+        colunas = primeiro[:, None] + np.arange(len(self.datas))
+        validos = colunas < len(self.datas)
+        alinhados = np.take_along_axis(
+            valores, np.minimum(colunas, len(self.datas) - 1), axis=1)
+        return(np.where(validos, alinhados, np.nan))
+
+    def ranking(self, metrica="casos", por_habitante=False, data=None,
+                n=None):
+        """ Ordena as cidades pelo valor da métrica em uma data
+
+        Retorna uma lista de tuplas (cidade, valor), da maior para a menor,
+        com os valores desconhecidos (NaN) no final.
+        Parametros:
+        -----------
+        data: str (AAAAMMDD) ou datetime64
+            Data usada. Se não for fornecida, usa o último dia.
+        n: int
+            Número de cidades retornadas. Se não for fornecido, todas.
+        """
+        coluna = -1
+        if data is not None:
+            coluna = int((data_dia(data) - self.datas[0])
+                         // np.timedelta64(1, 'D'))
+        valores = self.serie(metrica, por_habitante)[:, coluna]
+        valores = valores.astype(np.float64)
+        ordem = np.argsort(np.where(np.isnan(valores), -np.inf, -valores),
+                           kind='stable')[:n]
+        return([(self.cidades[i], valores[i].item()) for i in ordem])
+
+    def agrupa(self, metrica="casos", por_habitante=False):
+        """ Soma as cidades de cada região de saúde (DRS)
+
+        Retorna a lista de regiões e a matriz (região x dia).
+        """
+        (nomes, cod) = np.unique(np.array(self.regioes), return_inverse=True)
+        soma = np.zeros((len(nomes), len(self.datas)))
+        np.add.at(soma, cod, self.serie(metrica))
+        if por_habitante:
+            pop = np.bincount(cod, weights=np.maximum(self.pop, 0),
+                              minlength=len(nomes))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                soma = np.where(pop[:, None] > 0,
+                                soma * 1e5 / pop[:, None], np.nan)
+        return(nomes.tolist(), soma)
+
+    def numeros(self, periodo=14):
+        """ Números mais recentes de todas as cidades, como `Covid.numeros`
+
+        Calculados de uma só vez sobre as matrizes; a regressão usa apenas
+        os últimos `periodo` + 1 dias. Retorna uma lista na ordem de
+        `cidades`.
+        """
+        data = formata_datas(self.datas[-1:])[0]
+        dias = np.arange(len(self.datas))[-(periodo + 1):]
+        valores = {}
+        for (chave, metrica) in (("casos", "casos"), ("mortes", "obitos")):
+            valores[chave] = self.series[metrica][:, -1].tolist()
+            valores["media_" + chave] = self.serie(
+                metrica + "_novos")[:, -7:].mean(axis=1).tolist()
+            valores["dobro_" + chave] = regressao_movel(
+                dias, self.series[metrica][:, -(periodo + 1):],
+                periodo)["dobro"][:, -1].tolist()
+        return([dict(data=data, **{chave: lista[i] for chave, lista
+                                   in valores.items()})
+                for i in range(len(self.cidades))])
+
+    def assinatura(self, *dados):
+        """ Hash dos dados usados em um gráfico de comparação (ver
+        `assinatura_dados`)"""
+        return(assinatura_dados(self.nome, self.fonte, *dados))
+
+    def caminhos(self, nome):
+        """ Arquivos de um gráfico: o do dia e o mais recente"""
+        data = formata_datas(self.datas[-1:])[0]
+        extensao = self.renderizador.extensao
+        return(["img/" + data + "-SEADE-" + nome + extensao,
+                "img/SEADE-" + nome + extensao])
+
+    def graf_linhas(self, x, y, rotulos, metrica, por_habitante, titulo,
+                    alinhado=False):
+        """ Cria a figura com uma linha por cidade ou região"""
+        fig = plt.figure()
+        ax = fig.subplots()
+        for i in range(len(rotulos)):
+            ax.plot(x, y[i], label=rotulos[i])
+        ylabel = self.METRICAS[metrica]
+        if por_habitante:
+            ylabel += " por 100 mil habitantes"
+        ax.set_ylabel(ylabel)
+        if not metrica.endswith("_novos") and np.nanmax(y, initial=0) > 1:
+            ax.set_yscale('log')
+            ax.set_ylim(bottom=0.8)
+            corrige_y(ax)
+            ax.yaxis.set_minor_formatter(ticker.NullFormatter())
+        if alinhado:
+            ax.set_xlabel("Dias desde o primeiro caso")
+        else:
+            # marca uma data por semana, terminando no último dia
+            x_tick = x[::-7][::-1]
+            ax.set_xticks(x_tick)
+            ax.set_xticklabels(rotulos_datas(formata_datas(
+                self.datas[x_tick])), rotation=90)
+        ax.legend(loc="upper left", fontsize=7)
+        fig_add_title(fig, titulo)
+        fig.text(1, 0, self.fonte, fontsize=7, horizontalalignment='right',
+                 verticalalignment='bottom')
+        fig.tight_layout()
+        return(fig)
+
+    def graf_top(self, n=10, metrica="casos", por_habitante=True,
+                 alinhado=True):
+        """ Gera o gráfico das `n` cidades com os maiores valores da métrica
+
+        Parametros:
+        -----------
+        n: int
+            Número de cidades.
+        metrica: str
+            Uma das chaves de `METRICAS`.
+        por_habitante: bool
+            Usa valores por 100 mil habitantes.
+        alinhado: bool
+            Alinha as curvas pelo primeiro caso de cada cidade.
+        """
+        nome = ("top" + str(n) + "-" + metrica
+                + ("-100k" if por_habitante else "")
+                + ("-alinhado" if alinhado else ""))
+        caminhos = self.caminhos(nome)
+        assinatura = self.assinatura(nome, self.cidades, self.pop,
+                                     self.datas, self.series)
+        if not self.renderizador.precisa(caminhos, assinatura):
+            return
+        print("Gerando comparação das cidades: " + nome)
+        with etapa("desenho", cidade=self.nome, grafico=nome):
+            ranking = self.ranking(metrica, por_habitante, n=n)
+            linhas = [self.cidades.index(cidade) for cidade, _ in ranking]
+            if alinhado:
+                y = self.alinhados(metrica, por_habitante)[linhas]
+            else:
+                y = self.serie(metrica, por_habitante)[linhas]
+            titulo = (self.METRICAS[metrica] + " nas " + str(n)
+                      + " cidades com maiores valores")
+            fig = self.graf_linhas(np.arange(len(self.datas)), y,
+                                   [cidade for cidade, _ in ranking], metrica,
+                                   por_habitante, titulo, alinhado)
+        self.renderizador.salva(fig, caminhos, assinatura, self.nome)
+
+    def graf_regioes(self, metrica="casos", por_habitante=True):
+        """ Gera o gráfico com uma linha por região de saúde (DRS)"""
+        nome = ("regioes-" + metrica + ("-100k" if por_habitante else ""))
+        caminhos = self.caminhos(nome)
+        assinatura = self.assinatura(nome, self.cidades, self.regioes,
+                                     self.pop, self.datas, self.series)
+        if not self.renderizador.precisa(caminhos, assinatura):
+            return
+        print("Gerando comparação das regiões: " + nome)
+        with etapa("desenho", cidade=self.nome, grafico=nome):
+            (regioes, y) = self.agrupa(metrica, por_habitante)
+            titulo = self.METRICAS[metrica] + " por região de SP"
+            fig = self.graf_linhas(np.arange(len(self.datas)), y, regioes,
+                                   metrica, por_habitante, titulo)
+        self.renderizador.salva(fig, caminhos, assinatura, self.nome)
+
+    def tarefas(self, n=10, metricas=("casos", "obitos")):
+        """ Lista os gráficos de comparação como tarefas de `renderiza_lote`
+        """
+        tarefas = []
+        for metrica in metricas:
+            tarefas.append((self, "graf_top", {"n": n, "metrica": metrica}))
+            tarefas.append((self, "graf_regioes", {"metrica": metrica}))
+        return(tarefas)
+
+
+def preenche_matriz(matriz):
+    """ Repete o último valor conhecido (>= 0) de cada linha nos ausentes
+
+    Valores anteriores ao primeiro conhecido passam a ser 0.
+    """
+    conhecidos = matriz >= 0
+    indice = np.where(conhecidos, np.arange(matriz.shape[1]), 0)
+    np.maximum.accumulate(indice, axis=1, out=indice)
+    preenchida = np.take_along_axis(matriz, indice, axis=1)
+    return(np.where(preenchida < 0, 0, preenchida))
+
+
+def converte_na(valores):
+    """ Converte uma lista de str em inteiros, trocando `NA` por -1"""
+    valores = np.array(valores)
+    return(np.where(valores == "NA", "-1", valores).astype(np.int64))
+
+
+def novos_seade(datas, acumulado):
+    """ Calcula os valores diários a partir dos acumulados da SEADE
+
+    Ignora os dias sem dados e os anteriores ao primeiro caso.
+    Retorna a lista de datas (AAAAMMDD) e a de valores diários.
+    """
+    validos = acumulado >= 0
+    datas = datas[validos]
+    acumulado = acumulado[validos]
+    inicio = np.flatnonzero(acumulado)
+    if len(inicio) == 0:
+        return([], [])
+    datas = datas[inicio[0]:]
+    acumulado = acumulado[inicio[0]:]
+    return(formata_datas(datas), np.diff(acumulado, prepend=0).tolist())
+
+
+def download_seade(url=URL_SEADE, cache=DIR_CACHE, arquivo=None):
+    """ Obtem dados atualizados do SEADE e os separa por município
+
+    O CSV fica guardado em `cache` e só é baixado novamente quando o servidor
+    indica que houve mudança (ver `atualiza_cache_seade`).
+    Parametros:
+    -----------
+    url: str
+        Endereço do CSV da SEADE
+    cache: str
+        Diretório onde os dados baixados e processados são guardados
+    arquivo: str
+        Caminho de um CSV local. Se fornecido, nenhum acesso à rede é feito.
+    """
+    if arquivo is None:
+        arquivo = atualiza_cache_seade(url, cache)
+    return(carrega_indice_seade(arquivo, cache))
+
+
+def atualiza_cache_seade(url=URL_SEADE, cache=DIR_CACHE, timeout=60):
+    """ Baixa o CSV da SEADE apenas se ele mudou desde o último download
+
+    Usa os cabeçalhos ETag e Last-Modified da última resposta para fazer uma
+    requisição condicional. Se a conexão falhar e houver uma cópia no cache,
+    ela é usada.
+    Retorna o caminho do arquivo no cache.
+    """
+    os.makedirs(cache, exist_ok=True)
+    arquivo = os.path.join(cache, "dados_covid_sp.csv")
+    arquivo_meta = os.path.join(cache, "dados_covid_sp.json")
+    meta = {}
+    if os.path.exists(arquivo) and os.path.exists(arquivo_meta):
+        with open(arquivo_meta, 'r') as ent:
+            meta = json.load(ent)
+        if meta.get("url") != url:
+            meta = {}
+    requisicao = requisicoes.Request(url)
+    if meta.get("etag"):
+        requisicao.add_header("If-None-Match", meta["etag"])
+    if meta.get("last_modified"):
+        requisicao.add_header("If-Modified-Since", meta["last_modified"])
+    try:
+        with requisicoes.urlopen(requisicao, timeout=timeout) as resposta:
+            # salva em um arquivo temporário para não corromper o cache
+            with open(arquivo + ".tmp", 'wb') as tmp:
+                shutil.copyfileobj(resposta, tmp)
+            os.replace(arquivo + ".tmp", arquivo)
+            meta = {"url": url,
+                    "etag": resposta.headers.get("ETag"),
+                    "last_modified": resposta.headers.get("Last-Modified")}
+        with open(arquivo_meta, 'w') as saida:
+            json.dump(meta, saida)
+        print("Dados da SEADE atualizados")
+    except urllib.error.HTTPError as erro:
+        if erro.code != 304:
+            if not meta:
+                raise
+            print("Erro ao baixar dados da SEADE (" + str(erro.code)
+                  + "), usando cópia local")
+    except (urllib.error.URLError, OSError) as erro:
+        if not meta:
+            raise
+        print("Erro ao baixar dados da SEADE (" + str(erro)
+              + "), usando cópia local")
+    return(arquivo)
+
+
+def carrega_indice_seade(arquivo, cache=DIR_CACHE):
+    """ Cria o índice por município de um CSV da SEADE
+
+    O índice é guardado no cache com o hash do arquivo e a versão do
+    formato no nome, de forma que o mesmo CSV é processado uma única vez e
+    índices gravados por versões anteriores não são reaproveitados.
+    """
+    sha = hashlib.sha256()
+    with open(arquivo, 'rb') as ent:
+        for bloco in iter(lambda: ent.read(1 << 20), b''):
+            sha.update(bloco)
+    os.makedirs(cache, exist_ok=True)
+    nome_indice = ("seade-v" + str(VERSAO_INDICE_SEADE) + "-"
+                   + sha.hexdigest()[:16] + ".npz")
+    indice = os.path.join(cache, nome_indice)
+    if os.path.exists(indice):
+        return(IndiceSeade.abre(indice))
+    with open(arquivo, 'r', encoding='utf-8') as ent:
+        with etapa("seade", arquivo=arquivo):
+            dados = indexa_seade(ent)
+    dados.salva(indice + ".tmp")
+    os.replace(indice + ".tmp", indice)
+    # remove índices de versões anteriores dos dados
+    for nome in os.listdir(cache):
+        if (nome.startswith("seade-") and nome.endswith(".npz")
+                and nome != nome_indice):
+            os.remove(os.path.join(cache, nome))
+    return(dados)
+
+
+def tarefas_seade(cidades=None, dados_seade=None, renderizador=None):
+    """ Lista as tarefas de `renderiza_lote` para as cidades da SEADE
+
+    Parametros:
+    -----------
+    cidades: lista de str
+        Municípios a serem processados. Se não for fornecida, processa todos
+        os municípios presentes nos dados.
+    dados_seade: IndiceSeade
+        Dados já obtidos com `download_seade`. Se não forem fornecidos, são
+        baixados uma única vez para todas as cidades.
+    renderizador: Renderizador
+        Usado por todas as cidades.
+    """
+    if dados_seade is None:
+        dados_seade = download_seade()
+    if cidades is None:
+        cidades = [cidade for cidade in dados_seade.municipios()
+                   if cidade != "Ignorado"]
+    tarefas = []
+    for cidade in cidades:
+        print("Processando dados de " + cidade)
+        covid = Covid(nome=cidade, dados_seade=dados_seade,
+                      renderizador=renderizador)
+        tarefas += covid.tarefas(graficos=[""], atualiza_texto=True)
+    return(tarefas)
+
+
+def plt_seade(cidades=None, dados_seade=None, processos=1,
+              renderizador=None):
+    """ Gera os gráficos das cidades usando os dados da SEADE
+
+    Ver `tarefas_seade` e `renderiza_lote` para os parâmetros.
+    """
+    renderiza_lote(tarefas_seade(cidades, dados_seade, renderizador),
+                   processos)
+
+
+def renderiza_lote(tarefas, processos=1, memoria=False, diretorio_perfil=None,
+                   executor=None):
+    """ Executa as tarefas de geração de gráficos
+
+    Parametros:
+    -----------
+    tarefas: lista de tuplas (Covid, método, parâmetros)
+        Geradas por `Covid.tarefas` e `tarefas_seade`.
+    processos: int
+        Número de processos usados. Com 1, as tarefas são executadas no
+        próprio processo; com None, usa um processo por CPU.
+    memoria: bool
+        Mede a memória usada por cada tarefa (ver `mede_memoria`) e mostra o
+        maior valor de cada cidade ao final.
+    diretorio_perfil: str
+        Se fornecido, grava nele o perfil do cProfile de cada tarefa (ver
+        `perfil`).
+    executor: concurrent.futures.Executor
+        Processos já criados (ver `cria_processos`), usados no lugar de
+        `processos` e não encerrados ao final, para serem reaproveitados em
+        outras chamadas.
+    Retorna um dicionário com as medidas de memória por cidade.
+    """
+    executa = functools.partial(executa_tarefa, memoria=memoria,
+                                diretorio_perfil=diretorio_perfil)
+    encerra = executor is None
+    if executor is None:
+        executor = cria_processos(processos)
+    if executor is None:
+        resultados = map(executa, tarefas)
+    else:
+        resultados = executor.map(executa, tarefas)
+    picos = {}
+    manifestos = {}
+    try:
+        # consome os resultados para propagar erros dos processos
+        for tarefa, (nome, medidas, novas) in zip(tarefas, resultados):
+            manifesto = tarefa[0].renderizador.manifesto
+            if manifesto is not None:
+                manifesto.incorpora(novas)
+                manifestos[id(manifesto)] = manifesto
+            if memoria:
+                pico = picos.setdefault(nome, {"pico": 0, "rss": 0})
+                for chave, valor in medidas.items():
+                    pico[chave] = max(pico[chave], valor)
+    finally:
+        if encerra and executor is not None:
+            executor.shutdown()
+        for manifesto in manifestos.values():
+            manifesto.salva()
+    for nome, pico in picos.items():
+        print("Memória em " + nome + ": pico de "
+              + "{:.1f}".format(pico["pico"] / 2**20) + " MB, RSS cresceu "
+              + "até {:.1f}".format(pico["rss"] / 2**20) + " MB")
+    return(picos)
+
+
+def cria_processos(processos=1):
+    """ Processos usados por `renderiza_lote`
+
+    Com None, usa um processo por CPU. Retorna None se for apenas um, para
+    que as tarefas sejam executadas no próprio processo.
+    """
+    if processos is None:
+        processos = os.cpu_count() or 1
+    if processos == 1:
+        return(None)
+    return(concurrent.futures.ProcessPoolExecutor(
+        max_workers=processos, initializer=inicia_processo))
+
+
+def acompanha(cidades, intervalo=1.0, processos=1, ciclos=None, **opcoes):
+    """ Refaz os gráficos sempre que os arquivos das cidades mudarem
+
+    Os arquivos são verificados a cada `intervalo` segundos (tamanho e data
+    de modificação). Quando um deles muda, apenas as linhas novas são
+    processadas (`Covid.atualiza`) e os gráficos da cidade são enviados a
+    `renderiza_lote`, que refaz somente os afetados se houver um manifesto.
+    Os processos são criados uma só vez e mantidos entre as atualizações.
+    Termina com Ctrl+C.
+
+    A leitura leva milissegundos; o tempo de cada atualização é o de
+    redesenhar os gráficos cujos dados mudaram. Uma linha de casos no
+    último dia muda todos os gráficos com casos (15 dos 18 de Piracicaba,
+    cerca de 9 s em um processo) e um dia novo muda todos eles.
+    Parametros:
+    -----------
+    cidades: lista de Covid
+        Cidades com dados em arquivos.
+    intervalo: float
+        Tempo entre verificações, em segundos.
+    processos: int
+        Ver `renderiza_lote`.
+    ciclos: int
+        Número de verificações. Se não for fornecido, continua até Ctrl+C.
+    opcoes:
+        Parâmetros de `Covid.tarefas`.
+    """
+    estados = {}
+    for cidade in cidades:
+        estados[cidade.arquivo] = estado_arquivo(cidade.arquivo)
+    print("Acompanhando " + ", ".join(estados))
+    ciclo = 0
+    executor = cria_processos(processos)
+    try:
+        while ciclos is None or ciclo < ciclos:
+            ciclo += 1
+            time.sleep(intervalo)
+            for cidade in cidades:
+                estado = estado_arquivo(cidade.arquivo)
+                if estado == estados[cidade.arquivo]:
+                    continue
+                estados[cidade.arquivo] = estado
+                inicio = time.perf_counter()
+                try:
+                    mudou = cidade.atualiza()
+                except ErroValidacao as erro:
+                    print("Erros em " + cidade.arquivo + ", gráficos não "
+                          "atualizados:\n" + str(erro))
+                    continue
+                if mudou:
+                    renderiza_lote(cidade.tarefas(**opcoes),
+                                   executor=executor)
+                    print("Gráficos de " + cidade.nome + " atualizados em "
+                          + "{:.2f}".format(time.perf_counter() - inicio)
+                          + " s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def estado_arquivo(arquivo):
+    """ Tamanho e data de modificação do arquivo"""
+    info = os.stat(arquivo)
+    return(info.st_size, info.st_mtime_ns)
+
+
+def inicia_processo():
+    """ Configura os processos de `renderiza_lote` para não usar janelas"""
+    plt.switch_backend("Agg")
+
+
+def executa_tarefa(tarefa, memoria=False, diretorio_perfil=None):
+    """ Executa uma tarefa de `renderiza_lote`
+
+    Retorna o nome da cidade, as medidas de memória (se `memoria`) e as
+    entradas registradas no manifesto.
+    """
+    (covid, metodo, parametros) = tarefa
+    medidas = {}
+    with contextlib.ExitStack() as pilha:
+        if diretorio_perfil is not None:
+            # os parâmetros distinguem as tarefas de um mesmo método
+            rotulo = re.sub(r"[^\w.-]+", "_", "-".join(
+                [metodo] + [str(valor) for (_, valor)
+                            in sorted(parametros.items())
+                            if not isinstance(valor, bool)]))
+            pilha.enter_context(perfil(covid.nome, diretorio_perfil,
+                                       tarefa=rotulo))
+        if memoria:
+            pilha.enter_context(mede_memoria(medidas))
+        getattr(covid, metodo)(**parametros)
+    novas = {}
+    manifesto = covid.renderizador.manifesto
+    if manifesto is not None:
+        (novas, manifesto.novas) = (manifesto.novas, {})
+    return(covid.nome, medidas, novas)
+
+
+ARQUIVOS = ["Piracicaba.txt", "Campinas.txt"]
+CIDADES_SEADE = ["Campinas", "São Paulo", "Piracicaba", "Limeira",
+                 "Ribeirão Preto"]
+OPCOES_GRAFICOS = {"save": True, "atualiza_texto": True, "detalhes": True,
+                   "crescimento": (14,)}
+
+
+def atualiza_tudo(processos=None, memoria=False, diretorio_perfil=None,
+                  arquivo_seade=None, **saida):
+    """ Atualiza os gráficos e dados de todas as cidades
+
+    `processos`, `memoria` e `diretorio_perfil` são passados a
+    `renderiza_lote` e as opções em `saida` (formato, dpi, compressao,
+    copia) ao `Renderizador`. Se `arquivo_seade` for fornecido, os dados da
+    SEADE são lidos desse CSV em vez de baixados (ver `download_seade`).
+    """
+    # refaz apenas os gráficos cujos dados mudaram desde a última execução
+    renderizador = Renderizador(Manifesto(), **saida)
+    cidades = []
+    tarefas = []
+    for arquivo in ARQUIVOS:
+        print("Processando dados de " + arquivo[:-4] + ".")
+        cidade = Covid(arquivo, renderizador=renderizador)
+        cidades.append(cidade)
+        tarefas += cidade.tarefas(**OPCOES_GRAFICOS)
+    print("Atualizando dados do SEADE.")
+    dados_seade = download_seade(arquivo=arquivo_seade)
+    tarefas += tarefas_seade(CIDADES_SEADE, dados_seade, renderizador)
+    # comparação entre todos os municípios
+    painel = PainelSeade(dados_seade, renderizador=renderizador)
+    tarefas += painel.tarefas()
+    renderiza_lote(tarefas, processos, memoria, diretorio_perfil)
+    # tabelas para outros programas, refazendo apenas os dias novos
+    for cidade in cidades:
+        cidade.exporta(modo="acrescenta")
+    # páginas com os números e os gráficos de cada cidade
+    relatorio = Relatorio(renderizador.manifesto)
+    for cidade in cidades:
+        relatorio.adiciona_cidade(cidade)
+    relatorio.adiciona_seade(painel)
+    relatorio.grava()
+
+
+def resumo(arquivo):
+    """ Mostra os problemas encontrados e o número de registros e o período
+    de cada tipo de dado
+
+    Retorna o número de erros.
+    """
+    leitor = LeitorCasos().le(arquivo)
+    erros = 0
+    for (numero, nivel, mensagem, linha) in leitor.problemas:
+        print(arquivo + ":" + str(numero) + ": " + nivel + ": " + mensagem
+              + ": " + linha)
+        erros += nivel == "erro"
+    print(arquivo + ":")
+    for tipo in sorted(leitor.cons):
+        (datas, contagem) = leitor.consolidados(tipo)
+        det = leitor.detalhados(tipo)
+        print("  " + tipo + ": " + str(sum(contagem)) + " em "
+              + str(len(datas)) + " dias (" + datas[0] + " a " + datas[-1]
+              + "), " + str(len(det["data"])) + " registros detalhados")
+    return(erros)
+
+
+def mostra_ajustes(cidade, periodos):
+    """ Mostra o tempo para dobrar e o crescimento no último dia"""
+    print(cidade.nome + ":")
+    print("{:>9}{:>14}{:>12}{:>14}{:>12}".format(
+        "período", "casos dobram", "cresc./mês", "mortes dobram",
+        "cresc./mês"))
+    for periodo, ajuste in cidade.ajustes(periodos).items():
+        print("{:>9}{:>14.1f}{:>12.2f}{:>14.1f}{:>12.2f}".format(
+            periodo, ajuste["conf"]["dobro"][-1], ajuste["conf"]["cresc"][-1],
+            ajuste["mort"]["dobro"][-1], ajuste["mort"]["cresc"][-1]))
+
+
+def principal(argumentos=None):
+    """ Interface de linha de comando
+
+    Sem um comando, atualiza os gráficos e dados de todas as cidades.
+    Apenas os comandos `graficos`, `mostra`, `seade`, `acompanha`, `anima`
+    e `compacta` (com `--prancha`) importam o matplotlib.
+    """
+    parser = argparse.ArgumentParser(
+        description="Gráficos e dados de COVID-19 das cidades de SP")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="processos usados nos gráficos (padrão: um "
+                        "por CPU)")
+    parser.add_argument("--imagem", choices=sorted(FORMATOS_IMAGEM),
+                        default="png", help="formato dos gráficos")
+    parser.add_argument("--dpi", type=int, default=None,
+                        help="resolução dos gráficos (padrão: 100)")
+    parser.add_argument("--compressao", type=int, default=None,
+                        help="esforço de compressão: 0 a 9 no PNG, 0 a 6 no "
+                        "WebP")
+    parser.add_argument("--copia", choices=["copia", "link", "simbolico"],
+                        default="copia", help="como criar o arquivo sem "
+                        "data de cada gráfico a partir da cópia datada (ver "
+                        "Renderizador)")
+    parser.add_argument("--memoria", action="store_true",
+                        help="mostra a memória usada pelos gráficos de cada "
+                        "cidade")
+    parser.add_argument("--perfil", metavar="DIR",
+                        default=os.environ.get("COVID_PERFIL"),
+                        help="grava em DIR o perfil do cProfile de cada "
+                        "gráfico (ou use a variável COVID_PERFIL)")
+    parser.add_argument("--csv", help="CSV local da SEADE, em vez de baixar "
+                        "os dados")
+    comandos = parser.add_subparsers(dest="comando")
+    cmd = comandos.add_parser("valida", help="lê os arquivos e mostra um "
+                              "resumo dos dados")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd = comandos.add_parser("exporta", help="grava as séries calculadas "
+                              "(ver Covid.exporta)")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd.add_argument("--destino", default=DIR_DADOS)
+    cmd.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    cmd.add_argument("--modo", choices=["substitui", "acrescenta",
+                                        "particiona"], default="substitui")
+    cmd = comandos.add_parser("graficos", help="gera os gráficos das "
+                              "cidades")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd = comandos.add_parser("mostra", help="mostra os gráficos de casos e "
+                              "óbitos das cidades, sem salvá-los")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd = comandos.add_parser("ajuste", help="mostra o tempo para dobrar e o "
+                              "crescimento no último dia")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd.add_argument("--periodos", type=int, nargs="+",
+                     default=[7, 14, 21, 28])
+    cmd = comandos.add_parser("seade", help="gera os gráficos com os dados "
+                              "da SEADE")
+    cmd.add_argument("cidades", nargs="*", default=CIDADES_SEADE)
+    cmd.add_argument("--csv", default=argparse.SUPPRESS,
+                     help="CSV local, em vez de baixar os dados")
+    cmd.add_argument("--sem-painel", action="store_true",
+                     help="não gera os gráficos de comparação")
+    cmd = comandos.add_parser("acompanha", help="refaz os gráficos sempre "
+                              "que os arquivos mudarem")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd.add_argument("--intervalo", type=float, default=1.0)
+    cmd = comandos.add_parser("compacta", help="remove as cópias datadas "
+                              "repetidas ou antigas dos gráficos")
+    cmd.add_argument("--dias", type=int, default=30,
+                     help="mantém todas as cópias desse período")
+    cmd.add_argument("--semanas", type=int, default=26,
+                     help="depois, mantém uma cópia por semana")
+    cmd.add_argument("--meses", type=int, default=None,
+                     help="depois, mantém uma cópia por mês (padrão: "
+                     "sem limite)")
+    cmd.add_argument("--simula", action="store_true",
+                     help="apenas mostra o que seria removido")
+    cmd.add_argument("--prancha", action="store_true",
+                     help="junta as cópias antigas em uma imagem por "
+                     "gráfico")
+    cmd = comandos.add_parser("anima", help="grava a evolução dia a dia de "
+                              "um gráfico")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd.add_argument("--grafico", choices=["graf_all", "fit"],
+                     default="graf_all")
+    cmd.add_argument("--periodo", type=int, default=14)
+    cmd.add_argument("--proj", type=int, default=28)
+    cmd.add_argument("--fps", type=int, default=4,
+                     help="quadros por segundo")
+    cmd.add_argument("--extensao", choices=FORMATOS_ANIMACAO,
+                     default=".gif")
+    cmd = comandos.add_parser("relatorio", help="gera as páginas das "
+                              "cidades a partir do manifesto dos gráficos")
+    cmd.add_argument("arquivos", nargs="*", default=ARQUIVOS)
+    cmd.add_argument("--csv", default=argparse.SUPPRESS,
+                     help="CSV local, em vez de baixar os dados")
+    cmd.add_argument("--sem-seade", action="store_true",
+                     help="não inclui os municípios da SEADE")
+    cmd.add_argument("--destino", default="paginas")
+    args = parser.parse_args(argumentos)
+    saida = {"formato": args.imagem, "dpi": args.dpi,
+             "compressao": args.compressao, "copia": args.copia}
+    if args.comando is None:
+        atualiza_tudo(args.processos, args.memoria, args.perfil, args.csv,
+                      **saida)
+    elif args.comando == "valida":
+        erros = sum(resumo(arquivo) for arquivo in args.arquivos)
+        if erros:
+            parser.exit(1, str(erros) + " erro(s) encontrado(s)\n")
+    elif args.comando == "exporta":
+        for arquivo in args.arquivos:
+            Covid(arquivo).exporta(args.destino, args.formato, args.modo)
+    elif args.comando == "compacta":
+        Acervo(dias=args.dias, semanas=args.semanas, meses=args.meses,
+               manifesto=Manifesto()).compacta(args.simula, args.prancha)
+    elif args.comando == "ajuste":
+        for arquivo in args.arquivos:
+            mostra_ajustes(Covid(arquivo), args.periodos)
+    elif args.comando == "mostra":
+        for arquivo in args.arquivos:
+            Covid(arquivo).atualiza_graf(show=True)
+    elif args.comando == "relatorio":
+        relatorio = Relatorio(Manifesto(), args.destino)
+        for arquivo in args.arquivos:
+            relatorio.adiciona_cidade(Covid(arquivo))
+        if not args.sem_seade:
+            relatorio.adiciona_seade(PainelSeade(
+                download_seade(arquivo=args.csv)))
+        relatorio.grava()
+    elif args.comando == "anima":
+        for arquivo in args.arquivos:
+            cidade = Covid(arquivo)
+            sufixo = "-evolucao" if args.grafico == "graf_all" else (
+                "-projecao-" + str(args.periodo) + "-" + str(args.proj))
+            nome = cidade.nome.replace(' ', '_')
+            cidade.anima("img/" + nome + sufixo + args.extensao,
+                         args.grafico, args.periodo, args.proj, args.fps,
+                         args.dpi)
+    elif args.comando == "seade":
+        renderizador = Renderizador(Manifesto(), **saida)
+        dados_seade = download_seade(arquivo=args.csv)
+        tarefas = tarefas_seade(args.cidades, dados_seade, renderizador)
+        if not args.sem_painel:
+            tarefas += PainelSeade(dados_seade,
+                                   renderizador=renderizador).tarefas()
+        renderiza_lote(tarefas, args.processos, args.memoria, args.perfil)
+    else:
+        renderizador = Renderizador(Manifesto(), **saida)
+        cidades = [Covid(arquivo, renderizador=renderizador)
+                   for arquivo in args.arquivos]
+        tarefas = []
+        for cidade in cidades:
+            tarefas += cidade.tarefas(**OPCOES_GRAFICOS)
+        renderiza_lote(tarefas, args.processos, args.memoria, args.perfil)
+        if args.comando == "acompanha":
+            acompanha(cidades, args.intervalo, args.processos,
+                      **OPCOES_GRAFICOS)
+
+
+if __name__ == '__main__':
+    # COVID_LOG=DEBUG mostra o tempo de cada etapa
+    logging.basicConfig(level=os.environ.get("COVID_LOG", "WARNING"))
+    principal()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Testes de equivalência entre as versões vetorizadas e incrementais de
+`covid.py` e os algoritmos originais, feitos com laços sobre listas.
+
+Rodar com `python -m pytest tests` na raiz do projeto.
+'''
+
+import os
+import sys
+import json
+import random
+import datetime
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import covid  # noqa: E402
+
+
+def gera_linhas(dias=120, semente=1):
+    """ Linhas de um arquivo de cidade com casos, mortes, dias sem mortes,
+    registros sem detalhes e comentários"""
+    aleatorio = random.Random(semente)
+    inicio = datetime.date(2020, 3, 10)
+    linhas = ["## Data   Tipo   Número   Sexo   Idade  ## Observações"]
+    for i in range(dias):
+        data = (inicio + datetime.timedelta(days=i)).strftime("%Y%m%d")
+        if i % 7 == 5:
+            continue  # dia sem dados reportados
+        for _ in range(aleatorio.randint(1, 6)):
+            sexo = aleatorio.choice(["M", "F", "-"])
+            idade = aleatorio.choice(["--", str(aleatorio.randint(0, 99))])
+            linhas.append(data + "   P       " + str(aleatorio.randint(0, 9))
+                          + "       " + sexo + "      " + idade)
+        if i == 0:
+            linhas.append(data + "   P       3  ## sem detalhes")
+        if i >= 12 and aleatorio.random() < 0.6:
+            linhas.append(data + "   M       " + str(aleatorio.randint(1, 3))
+                          + "       " + aleatorio.choice(["M", "F"])
+                          + "      " + str(aleatorio.randint(40, 99)))
+    return([linha + "\n" for linha in linhas])
+
+
+def grava(caminho, linhas):
+    with open(caminho, 'w') as saida:
+        saida.write("".join(linhas))
+
+
+def estado(leitor):
+    """ Dados de um `LeitorCasos` em listas, para comparação"""
+    tipos = set(leitor.cons) | set(leitor.salvos["cons"]
+                                   if leitor.salvos else ())
+    dados = {"problemas": [tuple(problema) for problema in leitor.problemas],
+             "numero": leitor.numero, "posicao": leitor.posicao}
+    for tipo in sorted(tipos):
+        dados[tipo] = (leitor.consolidados(tipo),
+                       {chave: valores.tolist() for chave, valores
+                        in leitor.detalhados(tipo).items()})
+    return(dados)
+
+
+@pytest.fixture
+def arquivo(tmp_path):
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, gera_linhas())
+    return(caminho)
+
+
+# leitura incremental
+
+def test_linhas_acrescentadas(tmp_path):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, linhas[:200])
+    leitor = covid.LeitorCasos().le(caminho)
+    grava(caminho, linhas)
+    assert leitor.continua(caminho)
+    assert not leitor.continua(caminho)
+    assert estado(leitor) == estado(covid.LeitorCasos().le(caminho))
+
+
+def test_linha_incompleta(tmp_path):
+    linhas = gera_linhas()
+    texto = "".join(linhas)
+    caminho = str(tmp_path / "Cidade.txt")
+    # a última linha lida foi cortada no meio de um número
+    corte = len("".join(linhas[:150])) + 13
+    grava(caminho, [texto[:corte]])
+    leitor = covid.LeitorCasos().le(caminho)
+    grava(caminho, [texto])
+    leitor.continua(caminho)
+    assert estado(leitor) == estado(covid.LeitorCasos().le(caminho))
+
+
+def test_edicao_sem_mudar_tamanho(tmp_path):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, linhas[:200])
+    leitor = covid.LeitorCasos().le(caminho)
+    # troca o número de uma linha anterior e acrescenta outras
+    i = next(i for i, linha in enumerate(linhas)
+             if linha.split()[1:3] == ["P", "1"])
+    linhas[i] = linhas[i].replace("P       1", "P       8")
+    grava(caminho, linhas)
+    leitor.continua(caminho)
+    assert estado(leitor) == estado(covid.LeitorCasos().le(caminho))
+
+
+def test_arquivo_diminuiu(tmp_path):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, linhas)
+    leitor = covid.LeitorCasos().le(caminho)
+    grava(caminho, linhas[:100])
+    leitor.continua(caminho)
+    assert estado(leitor) == estado(covid.LeitorCasos().le(caminho))
+
+
+def test_linhas_invalidas(tmp_path):
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, ["20200310   P       2       F      30\n",
+                    "20200310   X       5\n",
+                    "20200311   P       1       H      40\n",
+                    "20200231   P       1\n"])
+    leitor = covid.LeitorCasos().le(caminho)
+    assert leitor.consolidados("P") == (["20200310", "20200311"], [2, 1])
+    assert "X" not in leitor.cons
+    assert [problema[2] for problema in leitor.problemas] == [
+        "tipo desconhecido", "sexo inválido (H)", "data inválida"]
+    assert leitor.detalhados("P")["quant"].tolist() == [2]
+
+
+# cache binário
+
+def test_cache_ida_e_volta(arquivo, tmp_path):
+    cache = str(tmp_path / "cache")
+    completo = estado(covid.LeitorCasos().le(arquivo))
+    assert estado(covid.carrega_casos(arquivo, cache)) == completo
+    aberto = covid.carrega_casos(arquivo, cache)
+    assert aberto.salvos is not None  # mapeado do cache, sem reler
+    assert estado(aberto) == completo
+    (datas, contagem) = aberto.colunas("P")
+    assert isinstance(datas, np.memmap)
+    assert contagem.dtype == np.int32
+
+
+def test_cache_versao(arquivo, tmp_path, monkeypatch):
+    cache = str(tmp_path / "cache")
+    covid.carrega_casos(arquivo, cache)
+    (destino,) = os.listdir(cache)
+    meta = os.path.join(cache, destino, "meta.json")
+    monkeypatch.setattr(covid, "VERSAO_CASOS", covid.VERSAO_CASOS + 1)
+    leitor = covid.carrega_casos(arquivo, cache)
+    assert leitor.salvos is None  # a versão antiga foi descartada
+    with open(meta, 'r') as ent:
+        assert json.load(ent)["versao"] == covid.VERSAO_CASOS
+    assert estado(leitor) == estado(covid.LeitorCasos().le(arquivo))
+
+
+def test_cache_arquivo_alterado(tmp_path):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    cache = str(tmp_path / "cache")
+    grava(caminho, linhas[:200])
+    covid.carrega_casos(caminho, cache)
+    i = next(i for i, linha in enumerate(linhas)
+             if linha.split()[1:3] == ["P", "1"])
+    linhas[i] = linhas[i].replace("P       1", "P       8")
+    grava(caminho, linhas)
+    assert (estado(covid.carrega_casos(caminho, cache))
+            == estado(covid.LeitorCasos().le(caminho)))
+    assert (covid.Covid(caminho, cache=cache).acc_conf
+            == covid.Covid(caminho, cache=None).acc_conf)
+
+
+def test_cache_por_caminho(tmp_path):
+    cache = str(tmp_path / "cache")
+    for (diretorio, semente) in (("a", 1), ("b", 2)):
+        os.makedirs(str(tmp_path / diretorio))
+        grava(str(tmp_path / diretorio / "Cidade.txt"),
+              gera_linhas(semente=semente))
+    for diretorio in ("a", "b", "a"):
+        caminho = str(tmp_path / diretorio / "Cidade.txt")
+        assert (estado(covid.carrega_casos(caminho, cache))
+                == estado(covid.LeitorCasos().le(caminho)))
+
+
+# séries
+
+def scrap_original(linhas, tipo):
+    datas = []
+    contagem = []
+    for linha in linhas:
+        campos = linha.split("##")[0].split()
+        if len(campos) < 3 or campos[1] != tipo:
+            continue
+        if datas and datas[-1] == campos[0]:
+            contagem[-1] += int(campos[2])
+        else:
+            datas.append(campos[0])
+            contagem.append(int(campos[2]))
+    return(datas, contagem)
+
+
+def dias_original(datas):
+    dias = [0]
+    anterior = datas[0]
+    conv_anterior = datetime.datetime.strptime(anterior, "%Y%m%d")
+    for data in datas:
+        if data != anterior:
+            conv = datetime.datetime.strptime(data, "%Y%m%d")
+            dias.append(abs(conv - conv_anterior).days + dias[-1])
+            anterior = data
+            conv_anterior = conv
+    return(dias)
+
+
+def media_original(dias, dados):
+    media = [0] * len(dias)
+    for i in range(len(dias)):
+        soma = 0
+        count = 0
+        for j in range(7):
+            if i - j >= 0 and dias[i - j] > dias[i] - 7:
+                soma += dados[i - j]
+                count += 1
+        media[i] = soma / max(count, 1)
+    return(media)
+
+
+def series_original(linhas):
+    """ Séries calculadas como no `Covid.__init__` original"""
+    (data, conf) = scrap_original(linhas, "P")
+    (data_mort, mortes) = scrap_original(linhas, "M")
+    dias = dias_original(data)
+    dias_mort = dias_original(data_mort)
+    diff_morte = abs((datetime.datetime.strptime(data_mort[0], "%Y%m%d")
+                      - datetime.datetime.strptime(data[0], "%Y%m%d")).days)
+    # completa_dados
+    primeiro = datetime.datetime.strptime(data_mort[0], "%Y%m%d")
+    completo = {"dias": [], "datas": [], "mortes": []}
+    for i in range(max(dias_mort[-1], dias[-1] - diff_morte) + 1):
+        completo["dias"].append(i)
+        if i in dias_mort:
+            completo["datas"].append(data_mort[dias_mort.index(i)])
+            completo["mortes"].append(mortes[dias_mort.index(i)])
+        else:
+            completo["datas"].append((primeiro + datetime.timedelta(days=i))
+                                     .strftime("%Y%m%d"))
+            completo["mortes"].append(0)
+    acc_conf = []
+    for valor in conf:
+        acc_conf.append((acc_conf[-1] if acc_conf else 0) + valor)
+    acc_mort = []
+    for valor in completo["mortes"]:
+        acc_mort.append((acc_mort[-1] if acc_mort else 0) + valor)
+    return({"data": data, "conf": conf, "dias": dias,
+            "data_mort": completo["datas"], "mortes": completo["mortes"],
+            "dias_mort": completo["dias"], "diff_morte": diff_morte,
+            "acc_conf": acc_conf, "acc_mort": acc_mort,
+            "dias_mort_corr": [dia + diff_morte for dia in completo["dias"]],
+            "med_conf": media_original(dias, conf),
+            "med_mort": media_original(completo["dias"],
+                                       completo["mortes"])})
+
+
+@pytest.mark.parametrize("cache", [None, "cache"])
+def test_calcula_series(tmp_path, cache):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, linhas)
+    if cache is not None:
+        cache = str(tmp_path / cache)
+        covid.Covid(caminho, cache=cache)  # a segunda leitura usa o cache
+    cidade = covid.Covid(caminho, cache=cache)
+    for chave, esperado in series_original(linhas).items():
+        valor = getattr(cidade, chave)
+        if chave.startswith("med_"):
+            np.testing.assert_allclose(valor, esperado)
+        elif chave == "diff_morte":
+            assert valor == esperado
+        else:
+            assert list(valor) == esperado, chave
+
+
+def test_atualiza(tmp_path):
+    linhas = gera_linhas()
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, linhas[:300])
+    cidade = covid.Covid(caminho, cache=None)
+    grava(caminho, linhas)
+    assert cidade.atualiza()
+    assert cidade.acc_conf == series_original(linhas)["acc_conf"]
+
+
+# regressões
+
+@pytest.mark.parametrize("periodo", [None, 7, 14])
+def test_regressao_movel(periodo):
+    aleatorio = np.random.default_rng(3)
+    x = np.cumsum(aleatorio.integers(1, 3, 60)).astype(float)
+    y = np.cumsum(aleatorio.integers(0, 20, 60)).astype(float)
+    y[:3] = 0  # pontos ignorados
+    ajuste = covid.regressao_movel(x, y, periodo)
+    for i in range(len(x)):
+        janela = (x > x[i] - periodo - 1) if periodo else np.ones_like(x,
+                                                                     bool)
+        janela &= (np.arange(len(x)) <= i) & (y > 0)
+        if janela.sum() < 2:
+            assert np.isnan(ajuste["a"][i])
+            continue
+        (a, log_b) = np.polyfit(x[janela], np.log(y[janela]), 1)
+        assert ajuste["a"][i] == pytest.approx(a, rel=1e-7, abs=1e-10)
+        assert np.log(ajuste["b"][i]) == pytest.approx(log_b, rel=1e-7,
+                                                       abs=1e-9)
+
+
+def test_regressao_movel_varias_series():
+    x = np.arange(30.0)
+    y = np.vstack((np.exp(0.1 * x), 5 * np.exp(0.05 * x)))
+    ajuste = covid.regressao_movel(x, y, 7)
+    np.testing.assert_allclose(ajuste["a"][:, 1:], [[0.1] * 29, [0.05] * 29])
+    np.testing.assert_allclose(ajuste["b"][:, 1:], [[1] * 29, [5] * 29])
+
+
+# demografia
+
+def demografia_original(det_conf, det_mort, inicio, fim, dias_rec=14):
+    """ Contagem registro a registro, como no `graf_detalhes` original"""
+    limite = fim - datetime.timedelta(days=dias_rec)
+    conf = np.zeros((len(covid.SEXOS), len(covid.FAIXAS)), dtype=int)
+    mort = np.zeros_like(conf)
+    recu = np.zeros_like(conf)
+    registros = [(det_conf, conf, True), (det_mort, mort, False)]
+    for (det, tabela, confirmados) in registros:
+        for i in range(len(det["data"])):
+            data = det["data"][i].astype(datetime.date)
+            if not inicio <= data <= fim:
+                continue
+            faixa = min(det["idade"][i] // 10 + 1, 10)
+            sexo = det["sexo"][i]
+            tabela[sexo, faixa] += det["quant"][i]
+            if confirmados and data < limite:
+                recu[sexo, faixa] += det["quant"][i]
+            elif not confirmados:
+                recu[sexo, faixa] -= det["quant"][i]
+    return(np.stack((conf, mort, np.maximum(recu, 0))))
+
+
+def test_demografia(arquivo):
+    cidade = covid.Covid(arquivo, cache=None)
+    primeiro = datetime.date(2020, 3, 10)
+    ultimo = cidade.fim_detalhes().astype(datetime.date)
+    np.testing.assert_array_equal(
+        cidade.demografia(),
+        demografia_original(cidade.det_conf, cidade.det_mort, primeiro,
+                            ultimo))
+    for (inicio, fim) in (("20200401", "20200430"), ("20200320", "20200615"),
+                          ("20200601", "20200607")):
+        np.testing.assert_array_equal(
+            cidade.demografia(inicio, fim),
+            demografia_original(
+                cidade.det_conf, cidade.det_mort,
+                datetime.datetime.strptime(inicio, "%Y%m%d").date(),
+                datetime.datetime.strptime(fim, "%Y%m%d").date()))
+
+
+def test_demografia_sem_detalhes(tmp_path):
+    caminho = str(tmp_path / "Cidade.txt")
+    grava(caminho, ["20200310   P       2\n", "20200311   P       1\n",
+                    "20200312   M       1\n"])
+    cidade = covid.Covid(caminho, cache=None)
+    assert cidade.det_acc is None
+    assert cidade.semanas_epidemiologicas() == []